@@ -3,17 +3,35 @@ from .combined_diffusers_loader import CombinedDiffusersLoader
 from .unet_loader import DiffusersUNETLoader
 from .clip_loader import DiffusersClipLoader
 from .vae_loader import DiffusersVAELoader
+from .memory_plan_report import DiffusersMemoryPlanReport
+from .warm_pool import ModelWarmPool, DiffusersWarmPool
+from .telemetry import LoadTelemetry
+from .prefetcher import ModelPrefetcher
+from .loader_config import PREFETCH_ON_QUEUE
+
+# Serve /diffusers_loader/metrics (Prometheus text) and /diffusers_loader/metrics.json when running inside ComfyUI
+LoadTelemetry.register_routes()
+# Serve /diffusers_loader/warm_pool for preloading and pinning checkpoints ahead of the jobs that need them
+ModelWarmPool.register_routes()
 
 NODE_CLASS_MAPPINGS = {
     "CombinedDiffusersLoader": CombinedDiffusersLoader,
     "DiffusersUNETLoader": DiffusersUNETLoader,
     "DiffusersClipLoader": DiffusersClipLoader,
-    "DiffusersVAELoader": DiffusersVAELoader
+    "DiffusersVAELoader": DiffusersVAELoader,
+    "DiffusersMemoryPlanReport": DiffusersMemoryPlanReport,
+    "DiffusersWarmPool": DiffusersWarmPool
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
     "CombinedDiffusersLoader": "Combined Diffusers Loader",
     "DiffusersUNETLoader": "Diffusers UNET Loader",
     "DiffusersClipLoader": "Diffusers CLIP Loader",
-    "DiffusersVAELoader": "Diffusers VAE Loader"
-}
\ No newline at end of file
+    "DiffusersVAELoader": "Diffusers VAE Loader",
+    "DiffusersMemoryPlanReport": "Diffusers Memory Plan (dry run)",
+    "DiffusersWarmPool": "Diffusers Warm Pool"
+}
+
+# Start warming the weights of queued prompts' loader nodes into the page cache while the current job runs
+if PREFETCH_ON_QUEUE:
+    ModelPrefetcher.register_prompt_handler(NODE_CLASS_MAPPINGS)
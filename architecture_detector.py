@@ -0,0 +1,132 @@
+# architecture_detector.py
+import os
+import json
+import threading
+from .fingerprint import ModelFingerprint
+from .safetensors_header import SafetensorsHeader
+from .utils import DiffusersUtils
+
+class ArchitectureDetector:
+    # Tells apart architectures that share a folder layout by reading only safetensors headers (key names and
+    # shapes), never tensor data. Results are kept per fingerprint of the files that were read.
+    # AuraFlow is checked first: its diffusers layout also has single_transformer_blocks
+    AURAFLOW_MARKERS = ("register_tokens", "joint_transformer_blocks.", "double_layers.")
+    FLUX_MARKERS = ("double_blocks.", "single_blocks.", "x_embedder.")
+    # Second dimension of the first cross-attention key projection, in diffusers and original layouts
+    CROSS_ATTENTION_KEYS = (
+        "down_blocks.0.attentions.0.transformer_blocks.0.attn2.to_k.weight",
+        "model.diffusion_model.input_blocks.1.1.transformer_blocks.0.attn2.to_k.weight",
+    )
+    TEXT_HIDDEN_KEYS = (
+        "text_model.final_layer_norm.weight",
+        "text_model.encoder.layers.0.self_attn.q_proj.weight",
+    )
+    CONTEXT_DIMS = {768: "SD15", 1024: "SD21"}
+    _results = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def header_source(cls, folder):
+        # The index or weight file the loaders would read from a component folder; .bin weights have no readable header
+        if not os.path.isdir(folder):
+            return None
+        try:
+            source = DiffusersUtils.find_index_file(folder) or DiffusersUtils.find_model_file(folder)
+        except FileNotFoundError:
+            return None
+        return source if source.endswith((".safetensors", ".json")) else None
+
+    @classmethod
+    def read_keys(cls, path):
+        # {key: shard path} for an index (its weight_map, no shard is opened), {key: shape} for a single file
+        if path.endswith(".json"):
+            with open(path, 'r') as f:
+                weight_map = json.load(f)["weight_map"]
+            base_path = os.path.dirname(path)
+            return {key: os.path.join(base_path, file_name) for key, file_name in weight_map.items()}
+        header, _ = SafetensorsHeader.read(path)
+        return {key: info["shape"] for key, info in header.items()}
+
+    @classmethod
+    def tensor_shape(cls, keys, key):
+        value = keys.get(key)
+        if isinstance(value, str):
+            # Index entry: read the header of the one shard that holds the key
+            header, _ = SafetensorsHeader.read(value)
+            return header[key]["shape"] if key in header else None
+        return value
+
+    @classmethod
+    def classify_transformer(cls, keys):
+        if any(key.startswith(cls.AURAFLOW_MARKERS) for key in keys):
+            return "AuraFlow"
+        if any(key.startswith(cls.FLUX_MARKERS) for key in keys):
+            return "Flux"
+        return None
+
+    @classmethod
+    def classify_context_dim(cls, keys, candidates, dim_index):
+        for key in candidates:
+            if key in keys:
+                shape = cls.tensor_shape(keys, key)
+                if shape and len(shape) > dim_index:
+                    return cls.CONTEXT_DIMS.get(shape[dim_index])
+        return None
+
+    @classmethod
+    def _cached(cls, paths, classify):
+        key = tuple(os.path.abspath(path) for path in paths)
+        fingerprints = [ModelFingerprint.get(path) for path in paths]
+        with cls._lock:
+            entry = cls._results.get(key)
+            if entry is not None and entry[0] == fingerprints:
+                return entry[1]
+        result = classify()
+        with cls._lock:
+            cls._results[key] = (fingerprints, result)
+        return result
+
+    @classmethod
+    def detect(cls, sub_dir_path, ambiguous_type):
+        # Resolves "AuraFlow_or_Flux" or "SD15_or_SD21"; returns ambiguous_type when the headers do not decide it
+        try:
+            if ambiguous_type == "AuraFlow_or_Flux":
+                source = cls.header_source(os.path.join(sub_dir_path, "transformer"))
+                if source is None:
+                    return ambiguous_type
+                result = cls._cached([source], lambda: cls.classify_transformer(cls.read_keys(source)))
+            elif ambiguous_type == "SD15_or_SD21":
+                sources = [cls.header_source(os.path.join(sub_dir_path, "unet")),
+                           cls.header_source(os.path.join(sub_dir_path, "text_encoder"))]
+                sources = [source for source in sources if source is not None]
+                if not sources:
+                    return ambiguous_type
+                result = cls._cached(sources, lambda: cls.classify_sd(sources))
+            else:
+                return ambiguous_type
+        except (OSError, ValueError, KeyError) as e:
+            print(f"ArchitectureDetector: Could not read weight headers under {sub_dir_path}: {e}")
+            return ambiguous_type
+
+        if result is None:
+            print(f"ArchitectureDetector: Weight headers under {sub_dir_path} do not match a known {ambiguous_type} layout")
+            return ambiguous_type
+        print(f"ArchitectureDetector: Detected {result} from weight headers under {sub_dir_path}")
+        return result
+
+    @classmethod
+    def classify_sd(cls, sources):
+        # The unet's cross-attention width decides it; the text encoder's hidden size is the fallback
+        for source in sources:
+            keys = cls.read_keys(source)
+            result = cls.classify_context_dim(keys, cls.CROSS_ATTENTION_KEYS, 1)
+            if result is None:
+                result = cls.classify_context_dim(keys, cls.TEXT_HIDDEN_KEYS, 0)
+            if result is not None:
+                return result
+        return None
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._results = {}
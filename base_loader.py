@@ -1,18 +1,136 @@
 # base_loader.py
 import os
-import json
 from .utils import DiffusersUtils
 from .model_type_config import MODEL_TYPE_CRITERIA
+from .telemetry import LoadTelemetry
+from .model_descriptor import ResolvedModel
+from .architecture_detector import ArchitectureDetector
+from .loader_config import ASYNC_LOAD_WORKERS
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
 
 class DiffusersLoaderBase:
+    _descriptors = {}
+    _descriptor_lock = threading.Lock()
+    # Loads in progress by load key, shared between node executions and load_async callers
+    _inflight = {}
+    _inflight_lock = threading.Lock()
+    _async_executor = None
+    _background = threading.local()
+
     @classmethod
-    def detect_model_type(cls, sub_dir_path):
-        model_index_path = os.path.join(sub_dir_path, "model_index.json")
-        
-        if os.path.exists(model_index_path):
-            with open(model_index_path, 'r') as f:
-                model_info = json.load(f)
+    def resolve(cls, sub_directory):
+        # Returns the shared ResolvedModel for a display name or path, rebuilt only when the directory changed
+        if isinstance(sub_directory, ResolvedModel):
+            return sub_directory
+        full_path = cls.resolve_full_path(sub_directory)
+        key = os.path.realpath(full_path)
+        signature = ResolvedModel.signature_of(full_path)
+        with cls._descriptor_lock:
+            descriptor = cls._descriptors.get(key)
+            if descriptor is not None and descriptor.signature == signature:
+                return descriptor
+
+        descriptor = ResolvedModel(full_path, ResolvedModel.read_model_info(full_path), signature)
+        descriptor.model_type = cls.detect_model_type(full_path, descriptor.model_info)
+        with cls._descriptor_lock:
+            cls._descriptors[key] = descriptor
+        return descriptor
+
+    @classmethod
+    def load_key(cls, name, sub_directory, *args):
+        full_path = cls.resolve(sub_directory).full_path
+        return (name, os.path.realpath(full_path)) + args
+
+    @classmethod
+    def load_shared(cls, key, fn):
+        # Runs fn() unless a load with the same key is already in flight, in which case that load's result is returned
+        with cls._inflight_lock:
+            future = cls._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = cls._inflight[key] = Future()
+        if owner:
+            cls._complete(key, future, fn)
+        else:
+            print(f"DiffusersLoaderBase: Waiting for the load of {key[1]} that is already in progress")
+        return future.result()
+
+    @classmethod
+    def submit_shared(cls, key, fn):
+        # Starts fn() on the background pool and returns its Future; a load with the same key in flight is reused
+        with cls._inflight_lock:
+            future = cls._inflight.get(key)
+            if future is not None:
+                return future
+            future = cls._inflight[key] = Future()
+            if cls._async_executor is None:
+                cls._async_executor = ThreadPoolExecutor(max_workers=max(1, ASYNC_LOAD_WORKERS), thread_name_prefix="DiffusersLoaderAsync")
+            executor = cls._async_executor
+        executor.submit(cls._complete, key, future, fn, True)
+        return future
+
+    @classmethod
+    def _complete(cls, key, future, fn, background=False):
+        cls._background.active = background
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            cls._background.active = False
+            with cls._inflight_lock:
+                if cls._inflight.get(key) is future:
+                    del cls._inflight[key]
+
+    @classmethod
+    def in_background_load(cls):
+        return getattr(cls._background, "active", False)
+
+    @classmethod
+    def IS_CHANGED(cls, sub_directory, **inputs):
+        # ComfyUI reruns the node when this value changes: the stat + safetensors header fingerprint of the files
+        # load_model would read, so edited weights are reloaded while unchanged ones hit the executor cache
+        return DiffusersUtils.fingerprint_files(cls.weight_paths(cls.resolve(sub_directory), **inputs))
+
+    @classmethod
+    def weight_paths(cls, model, **inputs):
+        raise NotImplementedError
+
+    @classmethod
+    def resolve_full_path(cls, sub_directory):
+        # Accepts either a path or a display name from INPUT_TYPES ("name" or "name (2)")
+        with LoadTelemetry.span("resolve", sub_directory=sub_directory):
+            if os.path.exists(sub_directory):
+                full_path = sub_directory
+            else:
+                model_directories = DiffusersUtils.get_model_directories()
+                _, unique_names = DiffusersUtils.get_unique_display_names(model_directories)
+                
+                if "(" in sub_directory:
+                    dir_name, index = sub_directory.rsplit(" (", 1)
+                    index = int(index[:-1]) - 1
+                    full_path = unique_names[dir_name][index]
+                else:
+                    full_path = unique_names[sub_directory][0]
             
+            if not os.path.exists(full_path):
+                raise ValueError(f"Selected directory does not exist: {full_path}")
+            return full_path
+
+    @classmethod
+    def detect_model_type(cls, sub_dir_path, model_info=None):
+        with LoadTelemetry.span("detect") as span:
+            model_type = cls._detect_model_type(sub_dir_path, model_info)
+            span["model_type"] = model_type
+            return model_type
+
+    @classmethod
+    def _detect_model_type(cls, sub_dir_path, model_info=None):
+        if model_info is None:
+            model_info = ResolvedModel.read_model_info(sub_dir_path)
+        
+        if model_info:
             class_name = model_info.get("_class_name")
             print("Class Name:", class_name)
             components = set(model_info.keys())
@@ -45,13 +163,13 @@ class DiffusersLoaderBase:
             elif os.path.exists(os.path.join(sub_dir_path, "text_encoder_2")):
                 return "SDXL"
             else:
-                # We can't reliably distinguish between AuraFlow and Flux based on folder structure alone
-                return "AuraFlow_or_Flux"
+                # AuraFlow and Flux share a folder structure; the transformer's tensor keys tell them apart
+                return ArchitectureDetector.detect(sub_dir_path, "AuraFlow_or_Flux")
         elif os.path.exists(os.path.join(sub_dir_path, "text_encoder_2")):
             return "SDXL"
         elif os.path.exists(os.path.join(sub_dir_path, "text_encoder")):
-            # We can't reliably distinguish between SD15 and SD21 based on folder structure alone
-            return "SD15_or_SD21"
+            # SD15 and SD21 share a folder structure; the cross-attention width tells them apart
+            return ArchitectureDetector.detect(sub_dir_path, "SD15_or_SD21")
         
         return "Unknown"
 
@@ -0,0 +1,373 @@
+# bench_loaders.py
+# Offline benchmark for the diffusers loaders. Builds synthetic diffusers checkpoints, stubs out
+# folder_paths / comfy.sd / comfy.utils and times discovery, model type detection, fingerprinting
+# and every loader's load_model on a CPU-only machine.
+#
+#   python benchmarks/bench_loaders.py --size tiny --copies 4 --repeat 3
+#   python benchmarks/bench_loaders.py --json bench.json
+#   python benchmarks/bench_loaders.py --baseline bench.json --tolerance 0.25
+import os
+import sys
+import json
+import time
+import enum
+import types
+import shutil
+import argparse
+import tempfile
+import threading
+import importlib.util
+import statistics
+
+import torch
+import safetensors.torch
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_NAME = "diffusers_loader_bench"
+
+# (hidden size, layers) of the synthetic weight files; "medium" produces files in the tens of MB
+SIZES = {
+    "tiny": (64, 2),
+    "medium": (1024, 8),
+}
+
+# Component folders written for every model type; sharded components get an index.json
+MODEL_LAYOUTS = {
+    "SD15": {"unet": 1, "text_encoder": 1, "vae": 1},
+    "SD21": {"unet": 1, "text_encoder": 1, "vae": 1},
+    "SDXL": {"unet": 1, "text_encoder": 1, "text_encoder_2": 1, "vae": 1},
+    "SD3": {"transformer": 1, "text_encoder": 1, "text_encoder_2": 1, "text_encoder_3": 2, "vae": 1},
+    "AuraFlow": {"transformer": 2, "text_encoder": 1, "vae": 1},
+    "Flux": {"transformer": 3, "text_encoder": 1, "text_encoder_2": 2, "vae": 1},
+}
+
+WEIGHT_NAMES = {
+    "unet": "diffusion_pytorch_model",
+    "transformer": "diffusion_pytorch_model",
+    "vae": "diffusion_pytorch_model",
+    "text_encoder": "model",
+    "text_encoder_2": "model",
+    "text_encoder_3": "model",
+}
+
+
+class RSSSampler:
+    # Samples the resident set size in a background thread to report the peak of one phase
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def rss_bytes():
+        try:
+            with open("/proc/self/statm", "r") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.rss_bytes())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.baseline = self.rss_bytes()
+        self.peak = self.baseline
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.rss_bytes())
+
+
+def make_tensors(prefix, hidden, layers, seed):
+    generator = torch.Generator().manual_seed(seed)
+    tensors = {}
+    for i in range(layers):
+        tensors[f"{prefix}.blocks.{i}.attn.weight"] = torch.randn(hidden, hidden, generator=generator, dtype=torch.float16)
+        tensors[f"{prefix}.blocks.{i}.attn.bias"] = torch.randn(hidden, generator=generator, dtype=torch.float16)
+        tensors[f"{prefix}.blocks.{i}.norm.weight"] = torch.ones(hidden, dtype=torch.float16)
+    return tensors
+
+
+def write_component(folder, component, num_shards, hidden, layers, seed):
+    os.makedirs(folder, exist_ok=True)
+    # The SD3 T5 checkpoint uses the transformers T5 key layout, which the CLIP loader selects on
+    prefix = "encoder" if component == "text_encoder_3" else component
+    tensors = make_tensors(prefix, hidden, layers * num_shards, seed)
+    name = WEIGHT_NAMES[component]
+    if num_shards == 1:
+        safetensors.torch.save_file(tensors, os.path.join(folder, f"{name}.safetensors"))
+        return
+
+    keys = list(tensors)
+    per_shard = (len(keys) + num_shards - 1) // num_shards
+    weight_map = {}
+    for shard in range(num_shards):
+        shard_name = f"{name}-{shard + 1:05d}-of-{num_shards:05d}.safetensors"
+        shard_keys = keys[shard * per_shard:(shard + 1) * per_shard]
+        safetensors.torch.save_file({key: tensors[key] for key in shard_keys}, os.path.join(folder, shard_name))
+        weight_map.update({key: shard_name for key in shard_keys})
+
+    # SD3's T5 index carries a variant tag, so the CLIP loader has to find it through the variant ranking
+    if component == "text_encoder_3":
+        index_name = "text_encoder_3_model.safetensors.index.fp16.json"
+    else:
+        index_name = f"{name}.safetensors.index.json"
+    total_size = sum(tensor.nelement() * tensor.element_size() for tensor in tensors.values())
+    with open(os.path.join(folder, index_name), "w") as f:
+        json.dump({"metadata": {"total_size": total_size}, "weight_map": weight_map}, f)
+
+
+def model_index_for(model_type, criteria):
+    model_index = {"_class_name": criteria["class_name"], "_diffusers_version": "0.30.0"}
+    for component in criteria["required_components"]:
+        model_index[component] = ["diffusers", "Placeholder"]
+    for key in ["feature_extractor", "requires_safety_checker", "force_zeros_for_empty_prompt", "image_encoder"]:
+        if key in criteria:
+            model_index[key] = criteria[key]
+    return model_index
+
+
+def build_tree(root, size, copies, depth, criteria):
+    hidden, layers = SIZES[size]
+    base_paths = [os.path.join(root, "diffusers_a"), os.path.join(root, "diffusers_b")]
+    models = []
+    seed = 0
+    for copy in range(copies):
+        for model_type, model_criteria in criteria.items():
+            # Alternate base paths and bury every other model deep in the tree to stress discovery
+            base_path = base_paths[copy % len(base_paths)]
+            nesting = [f"level_{level}" for level in range(depth)] if copy % 2 else []
+            model_dir = os.path.join(base_path, *nesting, f"{model_type.lower()}_{copy}")
+            for component, num_shards in MODEL_LAYOUTS[model_type].items():
+                seed += 1
+                write_component(os.path.join(model_dir, component), component, num_shards, hidden, layers, seed)
+            with open(os.path.join(model_dir, "model_index.json"), "w") as f:
+                json.dump(model_index_for(model_type, model_criteria), f)
+            # Non-weight folders that a naive walk would still descend into
+            for folder in ["scheduler", "tokenizer"]:
+                os.makedirs(os.path.join(model_dir, folder), exist_ok=True)
+                with open(os.path.join(model_dir, folder, "config.json"), "w") as f:
+                    f.write("{}")
+            models.append((model_type, model_dir))
+
+    vae_approx = os.path.join(root, "vae_approx")
+    os.makedirs(vae_approx, exist_ok=True)
+    for vae_type in ["taesd", "taesdxl", "taesd3", "taef1"]:
+        for part in ["encoder", "decoder"]:
+            seed += 1
+            safetensors.torch.save_file(make_tensors(part, 16, 1, seed), os.path.join(vae_approx, f"{vae_type}_{part}.safetensors"))
+    return base_paths, models
+
+
+def install_stubs(base_paths):
+    class StubModule(torch.nn.Module):
+        # Holds every tensor of a state dict as a buffer so cache memory accounting sees real sizes
+        def __init__(self, state_dict):
+            super().__init__()
+            for i, key in enumerate(list(state_dict.keys())):
+                self.register_buffer(f"t{i}", state_dict[key].clone())
+
+    class StubPatcher:
+        def __init__(self, state_dict):
+            self.model = StubModule(state_dict)
+
+    class StubCLIP:
+        def __init__(self, state_dicts):
+            merged = {}
+            for i, state_dict in enumerate(state_dicts):
+                merged.update({f"{i}.{key}": state_dict[key] for key in state_dict})
+            self.cond_stage_model = StubModule(merged)
+
+        def tokenize(self, text):
+            return text.split()
+
+    class StubVAE:
+        def __init__(self, sd=None):
+            self.first_stage_model = StubModule(sd)
+
+    def load_torch_file(ckpt, safe_load=False, device=None):
+        if ckpt.endswith(".safetensors"):
+            return safetensors.torch.load_file(ckpt, device="cpu")
+        return torch.load(ckpt, map_location="cpu", weights_only=safe_load)
+
+    folder_paths = types.ModuleType("folder_paths")
+    folder_paths.get_folder_paths = lambda name: list(base_paths) if name == "diffusers" else []
+
+    comfy = types.ModuleType("comfy")
+    comfy.__path__ = []
+    comfy_utils = types.ModuleType("comfy.utils")
+    comfy_utils.load_torch_file = load_torch_file
+    comfy_sd = types.ModuleType("comfy.sd")
+    comfy_sd.CLIPType = enum.Enum("CLIPType", ["STABLE_DIFFUSION", "STABLE_CASCADE", "SD3", "STABLE_AUDIO", "FLUX"])
+    comfy_sd.load_diffusion_model_state_dict = lambda sd, model_options={}: StubPatcher(sd)
+    comfy_sd.load_diffusion_model = lambda path, model_options={}: StubPatcher(load_torch_file(path))
+    comfy_sd.load_text_encoder_state_dicts = lambda state_dicts, embedding_directory=None, clip_type=None, model_options={}: StubCLIP(state_dicts)
+    comfy_sd.VAE = StubVAE
+    comfy_model_management = types.ModuleType("comfy.model_management")
+    comfy_model_management.unload_all_models = lambda: None
+    comfy_model_management.load_models_gpu = lambda models, force_full_load=False: None
+    comfy_model_management.text_encoder_offload_device = lambda: torch.device("cpu")
+    comfy.utils = comfy_utils
+    comfy.sd = comfy_sd
+    comfy.model_management = comfy_model_management
+
+    sys.modules["folder_paths"] = folder_paths
+    sys.modules["comfy"] = comfy
+    sys.modules["comfy.utils"] = comfy_utils
+    sys.modules["comfy.sd"] = comfy_sd
+    sys.modules["comfy.model_management"] = comfy_model_management
+
+
+def import_package():
+    spec = importlib.util.spec_from_file_location(
+        PACKAGE_NAME, os.path.join(PACKAGE_DIR, "__init__.py"), submodule_search_locations=[PACKAGE_DIR]
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE_NAME] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_criteria():
+    spec = importlib.util.spec_from_file_location("model_type_config", os.path.join(PACKAGE_DIR, "model_type_config.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.MODEL_TYPE_CRITERIA
+
+
+def measure(results, name, fn, repeat, setup=None):
+    timings = []
+    peaks = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with RSSSampler() as sampler:
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        peaks.append(sampler.peak - sampler.baseline)
+    results[name] = {
+        "seconds": statistics.median(timings),
+        "min_seconds": min(timings),
+        "peak_rss_delta_mb": max(peaks) / 1024 ** 2,
+    }
+
+
+def run(args):
+    criteria = load_criteria()
+    root = args.root or tempfile.mkdtemp(prefix="diffusers_bench_")
+    # The package reads its configuration at import time
+    os.environ["DIFFUSERS_LOADER_CACHE_DIR"] = os.path.join(root, "cache")
+    os.environ["DIFFUSERS_LOADER_CACHE_RAM_MB"] = "0"
+    os.environ["DIFFUSERS_LOADER_INDEX_TTL"] = "0"
+
+    try:
+        start = time.perf_counter()
+        base_paths, models = build_tree(root, args.size, args.copies, args.depth, criteria)
+        print(f"Built {len(models)} synthetic checkpoints in {time.perf_counter() - start:.2f}s under {root}")
+
+        install_stubs(base_paths)
+        package = import_package()
+        utils = sys.modules[f"{PACKAGE_NAME}.utils"]
+        DiffusersUtils = utils.DiffusersUtils
+        ModelDirectoryIndex = sys.modules[f"{PACKAGE_NAME}.directory_index"].ModelDirectoryIndex
+        ModelFingerprint = sys.modules[f"{PACKAGE_NAME}.fingerprint"].ModelFingerprint
+        DiffusersLoaderBase = sys.modules[f"{PACKAGE_NAME}.base_loader"].DiffusersLoaderBase
+        loaders = package.NODE_CLASS_MAPPINGS
+
+        results = {}
+        measure(results, "discovery_cold", DiffusersUtils.get_model_directories, args.repeat, setup=ModelDirectoryIndex.invalidate)
+        measure(results, "discovery_warm", DiffusersUtils.get_model_directories, args.repeat)
+
+        def detect_all():
+            for model_type, model_dir in models:
+                detected = DiffusersLoaderBase.detect_model_type(model_dir)
+                if detected != model_type:
+                    raise AssertionError(f"Detected {detected} for {model_type} checkpoint {model_dir}")
+        measure(results, "detect_model_type", detect_all, args.repeat)
+
+        weight_files = []
+        for _, model_dir in models:
+            for component in os.listdir(model_dir):
+                folder = os.path.join(model_dir, component)
+                if os.path.isdir(folder):
+                    weight_files.extend(os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".safetensors"))
+
+        def fingerprint_all():
+            for path in weight_files:
+                DiffusersUtils.get_model_hash(path)
+        measure(results, "fingerprint_cold", fingerprint_all, args.repeat, setup=ModelFingerprint.clear)
+        measure(results, "fingerprint_warm", fingerprint_all, args.repeat)
+
+        for model_type, model_dir in models[:len(criteria)]:
+            clip_type = {"SD3": "sd3", "Flux": "flux", "SDXL": "sdxl"}.get(model_type, "stable_diffusion")
+            measure(results, f"unet_load_model[{model_type}]",
+                    lambda: loaders["DiffusersUNETLoader"].load_model(model_dir), args.repeat)
+            measure(results, f"clip_load_model[{model_type}]",
+                    lambda: loaders["DiffusersClipLoader"].load_model(model_dir, clip_type), args.repeat)
+            measure(results, f"vae_load_model[{model_type}]",
+                    lambda: loaders["DiffusersVAELoader"].load_model(model_dir), args.repeat)
+            measure(results, f"combined_load_models[{model_type}]",
+                    lambda: loaders["CombinedDiffusersLoader"].load_models(os.path.basename(model_dir), clip_type), args.repeat)
+        measure(results, "vae_load_model[taesd]",
+                lambda: loaders["DiffusersVAELoader"].load_model(models[0][1], "taesd"), args.repeat)
+        return results
+    finally:
+        if not args.keep and not args.root:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        previous = baseline[name]["seconds"]
+        # Ignore sub-millisecond phases, their timings are dominated by noise
+        if previous > 0.001 and result["seconds"] > previous * (1 + tolerance):
+            regressions.append((name, previous, result["seconds"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the diffusers loaders against synthetic checkpoints")
+    parser.add_argument("--size", choices=sorted(SIZES), default="tiny")
+    parser.add_argument("--copies", type=int, default=2, help="Checkpoints generated per model type")
+    parser.add_argument("--depth", type=int, default=6, help="Nesting depth of every other checkpoint")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--root", help="Build the synthetic tree here instead of a temporary directory")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary tree after the run")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Results file of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    results = run(args)
+    width = max(len(name) for name in results)
+    print(f"{'phase'.ljust(width)}  {'median s':>10}  {'min s':>10}  {'peak RSS +MB':>12}")
+    for name, result in results.items():
+        print(f"{name.ljust(width)}  {result['seconds']:>10.4f}  {result['min_seconds']:>10.4f}  {result['peak_rss_delta_mb']:>12.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for name, previous, current in regressions:
+            print(f"REGRESSION {name}: {previous:.4f}s -> {current:.4f}s")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
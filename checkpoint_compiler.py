@@ -0,0 +1,227 @@
+# checkpoint_compiler.py
+import os
+import json
+import time
+import ctypes
+import hashlib
+import torch
+from .fingerprint import ModelFingerprint
+from .safetensors_header import SafetensorsHeader
+from .loader_config import COMPILED_DIR
+from .utils import DiffusersUtils
+
+class CheckpointCompiler:
+    # Consolidates a diffusers component (sharded or not) into one mmap-friendly safetensors file, optionally pre-cast.
+    # A manifest next to the output records the source fingerprint; loaders only use the output while it matches.
+    DTYPES = {
+        "fp8_e4m3fn": torch.float8_e4m3fn,
+        "fp8_e5m2": torch.float8_e5m2,
+    }
+    SAFETENSORS_DTYPES = {
+        torch.float64: "F64",
+        torch.float32: "F32",
+        torch.float16: "F16",
+        torch.bfloat16: "BF16",
+        torch.float8_e4m3fn: "F8_E4M3",
+        torch.float8_e5m2: "F8_E5M2",
+        torch.int64: "I64",
+        torch.int32: "I32",
+        torch.int16: "I16",
+        torch.int8: "I8",
+        torch.uint8: "U8",
+        torch.bool: "BOOL",
+    }
+    FLOAT_DTYPES = {"F64", "F32", "F16", "BF16", "F8_E4M3", "F8_E5M2"}
+    # Components whose weights the loaders read with weight_dtype applied
+    CASTABLE_COMPONENTS = ("unet", "transformer")
+
+    @staticmethod
+    def dtype_name(dtype):
+        if dtype is None:
+            return "native"
+        return str(dtype).replace("torch.", "")
+
+    @classmethod
+    def output_paths(cls, source_path, dtype=None):
+        # Deterministic location per source file and dtype, so loaders can find the output without a scan
+        source_path = os.path.realpath(source_path)
+        folder = os.path.join(COMPILED_DIR, hashlib.sha1(source_path.encode()).hexdigest()[:16])
+        component = os.path.basename(os.path.dirname(source_path))
+        output_path = os.path.join(folder, f"{component}.{cls.dtype_name(dtype)}.safetensors")
+        return output_path, output_path + ".manifest.json"
+
+    @classmethod
+    def read_manifest(cls, source_path, dtype=None):
+        _, manifest_path = cls.output_paths(source_path, dtype)
+        try:
+            with open(manifest_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @classmethod
+    def is_fresh(cls, manifest):
+        try:
+            return (
+                manifest["source_fingerprint"] == ModelFingerprint.get(manifest["source"])
+                and manifest["output_fingerprint"] == ModelFingerprint.get(manifest["output"])
+            )
+        except (OSError, ValueError, KeyError):
+            return False
+
+    @classmethod
+    def find_compiled(cls, source_path, dtype=None):
+        # Returns a fresh compiled file for source_path, preferring one already cast to dtype
+        candidates = [dtype, None] if dtype is not None else [None]
+        for candidate in candidates:
+            manifest = cls.read_manifest(source_path, candidate)
+            if manifest is None:
+                continue
+            if cls.is_fresh(manifest):
+                return manifest["output"]
+            print(f"CheckpointCompiler: Compiled copy of {source_path} is stale, loading the sources. Re-run the compiler to rebuild it.")
+        return None
+
+    @classmethod
+    def component_source(cls, folder):
+        # The file the loaders would read for this component: its best ranked index if sharded, otherwise the weight file
+        return DiffusersUtils.find_index_file(folder) or DiffusersUtils.find_model_file(folder)
+
+    @classmethod
+    def source_tensors(cls, source_path):
+        # (key, file, header entry) for every tensor of a safetensors file or index, without reading any data
+        if source_path.endswith(".json"):
+            with open(source_path, 'r') as f:
+                weight_map = json.load(f)['weight_map']
+            base_path = os.path.dirname(source_path)
+            files = DiffusersUtils.group_weight_map(weight_map)
+        else:
+            base_path = os.path.dirname(source_path)
+            files = {os.path.basename(source_path): None}
+
+        tensors = []
+        for file_name, keys in files.items():
+            file_path = os.path.join(base_path, file_name)
+            header, _ = SafetensorsHeader.read(file_path)
+            for key in (keys if keys is not None else sorted(header, key=lambda k: header[k]["data_offsets"][0])):
+                tensors.append((key, file_path, header[key]))
+        return tensors
+
+    @classmethod
+    def compile_file(cls, source_path, dtype=None, force=False):
+        output_path, manifest_path = cls.output_paths(source_path, dtype)
+        manifest = cls.read_manifest(source_path, dtype)
+        if not force and manifest is not None and cls.is_fresh(manifest):
+            print(f"CheckpointCompiler: {output_path} is up to date")
+            return output_path
+
+        print(f"CheckpointCompiler: Compiling {source_path} -> {output_path} (dtype: {cls.dtype_name(dtype)})")
+        start = time.perf_counter()
+        source_fingerprint = ModelFingerprint.get(source_path)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"
+        try:
+            if source_path.endswith(".bin"):
+                tensor_count = cls._write_from_state_dict(source_path, tmp_path, dtype)
+            else:
+                tensor_count = cls._write_streaming(source_path, tmp_path, dtype)
+            os.replace(tmp_path, output_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        manifest = {
+            "source": os.path.realpath(source_path),
+            "source_fingerprint": source_fingerprint,
+            "output": output_path,
+            "output_fingerprint": ModelFingerprint.get(output_path),
+            "dtype": cls.dtype_name(dtype),
+            "tensors": tensor_count,
+            "created": time.time(),
+        }
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        print(f"CheckpointCompiler: Wrote {tensor_count} tensors in {time.perf_counter() - start:.1f}s")
+        return output_path
+
+    @classmethod
+    def _write_from_state_dict(cls, source_path, output_path, dtype):
+        # Pickle checkpoints have no header to plan from, so they are loaded whole before writing
+        import safetensors.torch
+        state_dict = DiffusersUtils.load_state_dict(source_path, lazy=False, dtype=dtype)
+        safetensors.torch.save_file({key: value.contiguous() for key, value in state_dict.items()}, output_path)
+        return len(state_dict)
+
+    @classmethod
+    def _write_streaming(cls, source_path, output_path, dtype):
+        # The output header is planned from the source headers, then tensors are read, cast and written one at a time
+        tensors = cls.source_tensors(source_path)
+        target = cls.SAFETENSORS_DTYPES[dtype] if dtype is not None else None
+        element_sizes = {cls.SAFETENSORS_DTYPES[d]: torch.empty((), dtype=d).element_size() for d in cls.SAFETENSORS_DTYPES}
+
+        header = {"__metadata__": {"format": "pt", "source": os.path.basename(source_path), "dtype": cls.dtype_name(dtype)}}
+        offset = 0
+        for key, _, entry in tensors:
+            out_dtype = entry["dtype"]
+            # Mirrors DiffusersUtils.cast_tensor: only floating point tensors with two or more dimensions are cast
+            if target is not None and out_dtype in cls.FLOAT_DTYPES and len(entry["shape"]) >= 2:
+                out_dtype = target
+            nbytes = element_sizes[out_dtype]
+            for dim in entry["shape"]:
+                nbytes *= dim
+            header[key] = {"dtype": out_dtype, "shape": entry["shape"], "data_offsets": [offset, offset + nbytes]}
+            offset += nbytes
+
+        header_bytes = json.dumps(header, separators=(",", ":")).encode()
+        header_bytes += b" " * (-len(header_bytes) % 8)
+
+        with open(output_path, 'wb') as out:
+            out.write(len(header_bytes).to_bytes(8, "little"))
+            out.write(header_bytes)
+            for file_path, keys in cls._group_by_file(tensors):
+                part = DiffusersUtils.load_shard(file_path, keys, dtype=dtype)
+                for key in keys:
+                    tensor = part.pop(key).contiguous()
+                    expected = header[key]["data_offsets"][1] - header[key]["data_offsets"][0]
+                    nbytes = tensor.nelement() * tensor.element_size()
+                    if nbytes != expected or cls.SAFETENSORS_DTYPES[tensor.dtype] != header[key]["dtype"]:
+                        raise ValueError(f"Tensor '{key}' does not match its planned layout in {output_path}")
+                    if nbytes:
+                        out.write(ctypes.string_at(tensor.data_ptr(), nbytes))
+                    del tensor
+        return len(tensors)
+
+    @staticmethod
+    def _group_by_file(tensors):
+        # Consecutive keys of the same file are read together; the planned key order is kept
+        groups = []
+        for key, file_path, _ in tensors:
+            if groups and groups[-1][0] == file_path:
+                groups[-1][1].append(key)
+            else:
+                groups.append((file_path, [key]))
+        return groups
+
+    @classmethod
+    def compile_model(cls, full_path, weight_dtype="default", components=None, force=False):
+        # Compiles every weight component of a diffusers directory; weight_dtype only applies to unet/transformer
+        dtype = cls.DTYPES.get(weight_dtype)
+        outputs = {}
+        model_info = {}
+        model_index_path = os.path.join(full_path, "model_index.json")
+        if os.path.exists(model_index_path):
+            with open(model_index_path, 'r') as f:
+                model_info = json.load(f)
+        for component in sorted(model_info) or sorted(os.listdir(full_path)):
+            folder = os.path.join(full_path, component)
+            if component.startswith("_") or not os.path.isdir(folder):
+                continue
+            if components and component not in components:
+                continue
+            try:
+                source_path = cls.component_source(folder)
+            except FileNotFoundError:
+                continue
+            component_dtype = dtype if component in cls.CASTABLE_COMPONENTS else None
+            outputs[component] = cls.compile_file(source_path, component_dtype, force=force)
+        return outputs
@@ -0,0 +1,168 @@
+# checkpoint_validator.py
+import os
+import json
+import threading
+from .fingerprint import ModelFingerprint
+from .safetensors_header import SafetensorsHeader
+
+class CheckpointValidator:
+    # Header-only integrity checks: safetensors headers against file sizes, index weight_maps against their shards
+    # and model_index.json components against their folders. No tensor data is read. Results are kept per
+    # fingerprint, so a file is checked again only after it changed.
+    DTYPE_SIZES = {
+        "F64": 8, "F32": 4, "F16": 2, "BF16": 2, "F8_E4M3": 1, "F8_E5M2": 1,
+        "I64": 8, "I32": 4, "I16": 2, "I8": 1, "U64": 8, "U32": 4, "U16": 2, "U8": 1, "BOOL": 1,
+    }
+    # model_index.json components that come without weights, by class name or by component name
+    WEIGHTLESS_CLASS_SUFFIXES = ("Tokenizer", "TokenizerFast", "Scheduler", "Processor", "FeatureExtractor")
+    WEIGHTLESS_COMPONENT_PREFIXES = ("scheduler", "tokenizer", "feature_extractor", "image_processor")
+    _results = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def _cached(cls, kind, path, fingerprint, check):
+        key = (kind, os.path.abspath(path))
+        with cls._lock:
+            entry = cls._results.get(key)
+            if entry is not None and entry[0] == fingerprint:
+                return entry[1]
+        problems = check(path)
+        with cls._lock:
+            cls._results[key] = (fingerprint, problems)
+        return problems
+
+    @classmethod
+    def validate_file(cls, path, allow_missing=False):
+        # Problems with one weight file, or with an index and every shard it references.
+        # allow_missing tolerates shards and keys an index lists but does not have, like the skip_missing loads.
+        if not os.path.exists(path):
+            return [f"'{path}' does not exist"]
+        try:
+            fingerprint = ModelFingerprint.get(path)
+        except (OSError, ValueError) as e:
+            return [f"'{path}' could not be read: {e}"]
+        if path.endswith(".json"):
+            return cls._cached(("index", allow_missing), path, fingerprint, lambda index_path: cls._check_index(index_path, allow_missing))
+        return cls._cached("file", path, fingerprint, cls._check_file)
+
+    @classmethod
+    def _check_file(cls, path):
+        if not path.endswith(".safetensors"):
+            return [] if os.path.getsize(path) > 0 else [f"'{path}' is empty"]
+        try:
+            header_size, header_bytes = SafetensorsHeader.read_raw(path)
+            header = json.loads(header_bytes)
+        except ValueError as e:
+            return [str(e)]
+        header.pop("__metadata__", None)
+
+        problems = []
+        data_size = os.path.getsize(path) - 8 - header_size
+        data_end = 0
+        for key, info in header.items():
+            start, end = info["data_offsets"]
+            data_end = max(data_end, end)
+            item_size = cls.DTYPE_SIZES.get(info["dtype"])
+            if item_size is not None:
+                expected = item_size
+                for dim in info["shape"]:
+                    expected *= dim
+                if end - start != expected:
+                    problems.append(f"Tensor '{key}' in '{path}' spans {end - start} bytes, its shape needs {expected}")
+        if data_end != data_size:
+            problems.append(f"'{path}' holds {data_size} bytes of tensor data but its header describes {data_end} (truncated or partial download?)")
+        return problems
+
+    @classmethod
+    def _check_index(cls, index_path, allow_missing=False):
+        # utils imports this module, so the import waits until it is needed
+        from .utils import DiffusersUtils
+        try:
+            with open(index_path, 'r') as f:
+                weight_map = json.load(f)["weight_map"]
+        except (ValueError, KeyError) as e:
+            return [f"'{index_path}' is not a valid index: {e}"]
+
+        problems = []
+        base_path = os.path.dirname(index_path)
+        for file_name, keys in DiffusersUtils.group_weight_map(weight_map).items():
+            shard_path = os.path.join(base_path, file_name)
+            if allow_missing and not os.path.exists(shard_path):
+                continue
+            shard_problems = cls.validate_file(shard_path)
+            problems.extend(shard_problems)
+            if shard_problems or not shard_path.endswith(".safetensors"):
+                continue
+            header, _ = SafetensorsHeader.read(shard_path)
+            missing = [key for key in keys if key not in header]
+            if missing and not allow_missing:
+                problems.append(f"{len(missing)} tensor(s) listed in '{index_path}' are missing from '{shard_path}', e.g. '{missing[0]}'")
+        return problems
+
+    @classmethod
+    def weight_candidates(cls, folder):
+        # An index makes its shards part of one candidate; every other weight file is a candidate on its own.
+        # Ranked like the loaders rank them, so problems are reported for the file a load would pick.
+        from .utils import DiffusersUtils
+        try:
+            return DiffusersUtils.find_model_files(folder)
+        except FileNotFoundError:
+            return []
+
+    @classmethod
+    def validate_model(cls, full_path):
+        # Every weight-bearing component listed in model_index.json needs at least one complete set of weights
+        model_index_path = os.path.join(full_path, "model_index.json")
+        if not os.path.exists(model_index_path):
+            return []
+        try:
+            with open(model_index_path, 'r') as f:
+                model_info = json.load(f)
+        except ValueError as e:
+            return [f"'{model_index_path}' is not valid JSON: {e}"]
+
+        problems = []
+        for component, value in sorted(model_info.items()):
+            if component.startswith("_") or not isinstance(value, list) or len(value) != 2 or value[1] is None:
+                continue
+            if str(value[1]).endswith(cls.WEIGHTLESS_CLASS_SUFFIXES) or component.startswith(cls.WEIGHTLESS_COMPONENT_PREFIXES):
+                continue
+            folder = os.path.join(full_path, component)
+            if not os.path.isdir(folder):
+                problems.append(f"Component folder '{component}' listed in model_index.json is missing from {full_path}")
+                continue
+            candidates = cls.weight_candidates(folder)
+            if not candidates:
+                problems.append(f"Component folder '{folder}' has no weight files")
+                continue
+            candidate_problems = [cls.validate_file(candidate) for candidate in candidates]
+            if all(candidate_problems):
+                problems.extend(candidate_problems[0])
+        return problems
+
+    @classmethod
+    def validate_models(cls, model_paths):
+        # Discovery-time pass over newly found checkpoints; returns {path: problems} for the broken ones
+        report = {}
+        for full_path in model_paths:
+            problems = cls.validate_model(full_path)
+            if problems:
+                report[full_path] = problems
+                print(f"CheckpointValidator: {full_path} is incomplete or corrupt:")
+                for problem in problems:
+                    print(f"CheckpointValidator:   {problem}")
+        print(f"CheckpointValidator: Checked {len(model_paths)} checkpoint(s), {len(report)} with problems")
+        return report
+
+    @classmethod
+    def check(cls, paths, allow_missing=False):
+        # Raises before any tensor data is read when one of the weight files (or their shards) is broken
+        for path in ([paths] if isinstance(paths, str) else paths):
+            problems = cls.validate_file(path, allow_missing)
+            if problems:
+                raise ValueError(f"Checkpoint '{path}' failed validation: " + "; ".join(problems[:5]))
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._results = {}
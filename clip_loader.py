@@ -1,19 +1,26 @@
 # clip_loader.py
 import os
-import json
 import torch
 import comfy.sd
-import comfy.utils
+import comfy.model_management
 from .base_loader import DiffusersLoaderBase
 from .utils import DiffusersUtils
+from .telemetry import LoadTelemetry
+from .loader_config import MMAP_LOADING, SHARE_COMPONENTS
 
 class DiffusersClipLoader(DiffusersLoaderBase):
+    # Tensors comfy's T5 text encoder reads from the SD3 text_encoder_3 checkpoint
+    T5_ENCODER_KEY_PREFIXES = ("shared.", "encoder.")
+
     @classmethod
     def INPUT_TYPES(cls):
         return {
             "required": {
                 "sub_directory": (DiffusersUtils.get_unique_display_names(DiffusersUtils.get_model_directories())[0],),
                 "clip_type": (["stable_diffusion", "stable_cascade", "sd3", "stable_audio", "sdxl", "flux"],),
+            },
+            "optional": {
+                "variant": (DiffusersUtils.WEIGHT_VARIANT_CHOICES,),
             }
         }
     
@@ -22,65 +29,94 @@ class DiffusersClipLoader(DiffusersLoaderBase):
     CATEGORY = "DiffusersLoader"
 
     @classmethod
-    def load_clip(cls, sub_directory, clip_type="stable_diffusion"):
-        return (cls.load_model(sub_directory, clip_type,),)
+    def load_clip(cls, sub_directory, clip_type="stable_diffusion", variant="auto"):
+        return (cls.load_model(sub_directory, clip_type, variant),)
+
+    @classmethod
+    def load_model(cls, sub_directory, clip_type="stable_diffusion", variant="auto"):
+        key = cls.load_key("clip", sub_directory, clip_type, variant)
+        return cls.load_shared(key, lambda: cls._load_model(sub_directory, clip_type, variant))
+
+    @classmethod
+    def load_async(cls, sub_directory, clip_type="stable_diffusion", variant="auto"):
+        # Future for what load_model returns, loaded on the background pool
+        key = cls.load_key("clip", sub_directory, clip_type, variant)
+        return cls.submit_shared(key, lambda: cls._load_model(sub_directory, clip_type, variant))
+
+    @classmethod
+    def _load_model(cls, sub_directory, clip_type="stable_diffusion", variant="auto"):
+        with LoadTelemetry.load("clip", sub_directory):
+            job = cls.prepare_load(sub_directory, clip_type, variant)
+            if job["cached"] is not None:
+                return job["cached"]
+            return cls.build_model(job, cls.read_state_dict(job))
+
+    @classmethod
+    def prefetch(cls, sub_directory, clip_type="stable_diffusion", variant="auto"):
+        # Queues the files load_model would read for background page-cache warming
+        model = cls.resolve(sub_directory)
+        return DiffusersUtils.prefetch_files(cls.weight_paths(model, variant=variant))
 
     @classmethod
-    def load_model(cls, sub_directory, clip_type="stable_diffusion"):
-        if os.path.exists(sub_directory):
-            full_path = sub_directory
-        else:
-            model_directories = DiffusersUtils.get_model_directories()
-            _, unique_names = DiffusersUtils.get_unique_display_names(model_directories)
+    def weight_paths(cls, model, clip_type="stable_diffusion", variant="auto"):
+        # The text encoder files (or indexes) load_model reads, memoized on the shared ResolvedModel
+        return model.weight_file(("clip", variant), lambda: cls.get_text_encoder_paths(model.full_path, model.model_type, variant))
+
+    @classmethod
+    def prepare_load(cls, sub_directory, clip_type="stable_diffusion", variant="auto"):
+        # Resolves everything needed to load the text encoders without reading any weights
+        model = cls.resolve(sub_directory)
+        full_path, model_type = model.full_path, model.model_type
         
-            if "(" in sub_directory:
-                dir_name, index = sub_directory.rsplit(" (", 1)
-                index = int(index[:-1]) - 1
-                full_path = unique_names[dir_name][index]
-            else:
-                full_path = unique_names[sub_directory][0]
+        text_encoder_paths = cls.weight_paths(model, variant=variant)
+        # The SD3 T5 index is read with skip_missing, so the shards and keys it lists but lacks are tolerated here too
+        DiffusersUtils.validate_weights([path for path in text_encoder_paths if not cls.is_sd3_text_encoder_3_index(path)])
+        DiffusersUtils.validate_weights([path for path in text_encoder_paths if cls.is_sd3_text_encoder_3_index(path)], allow_missing=True)
         
-        if not os.path.exists(full_path):
-            raise ValueError(f"Selected directory does not exist: {full_path}")
+        # Checkpoints with identical text encoders share one cached CLIP unless they bring their own embeddings
+        shared = SHARE_COMPONENTS and not os.path.isdir(os.path.join(full_path, "embeddings"))
+        fingerprint = DiffusersUtils.check_and_clear_cache('clip', text_encoder_paths)
+        cache_key = DiffusersUtils.model_cache_key('clip', full_path, fingerprint, clip_type=clip_type)
+        if shared:
+            cache_key = DiffusersUtils.shared_cache_key('clip', cache_key, text_encoder_paths)
         
-        model_type = cls.detect_model_type(full_path)
+        return {
+            "full_path": full_path,
+            "model_type": model_type,
+            "clip_type_enum": cls.get_clip_type_enum(clip_type),
+            "text_encoder_paths": text_encoder_paths,
+            "cache_key": cache_key,
+            "cached": DiffusersUtils.get_cached_model(cache_key),
+        }
 
-        clip_type_enum = cls.get_clip_type_enum(clip_type)
-        
-        text_encoder_paths = cls.get_text_encoder_paths(full_path, model_type)
-        
+    @classmethod
+    def read_state_dict(cls, job):
         clip_data = []
-        for path in text_encoder_paths:
+        for path in job["text_encoder_paths"]:
             try:
-                if isinstance(path, dict):
-                    clip_data.append(path)
-                elif path.endswith('index.json'):
-                    with open(path, 'r') as f:
-                        index_data = json.load(f)
-                    weight_map = index_data['weight_map']
-                    state_dict = {}
-                    
-                    for key, file in weight_map.items():
-                        file_path = os.path.join(os.path.dirname(path), file)
-                        part_dict = comfy.utils.load_torch_file(file_path, safe_load=True)
-                        state_dict.update(part_dict)
-                        del part_dict
-                        torch.cuda.empty_cache()
-                    
-                    clip_data.append(state_dict)
-                    
+                if cls.is_sd3_text_encoder_3_index(path):
+                    clip_data.append(cls.load_sd3_text_encoder_3(path))
                 else:
-                    DiffusersUtils.check_and_clear_cache('clip', path)
-                    clip_data.append(comfy.utils.load_torch_file(path, safe_load=True))
+                    clip_data.append(DiffusersUtils.load_state_dict(path))
             except Exception as e:
                 print(f"Error loading clip model part from {path}: {e}")
                 raise
-            
-        print(f"DiffusersClipLoader: Loading CLIP model(s) from: {text_encoder_paths}")
+        return clip_data
+
+    @classmethod
+    def build_model(cls, job, clip_data):
+        print(f"DiffusersClipLoader: Loading CLIP model(s) from: {job['text_encoder_paths']}")
+        model_options = {}
+        if cls.in_background_load():
+            # comfy would otherwise build it on the GPU through load_models_gpu, which changes its loaded models
+            # without a lock and may unload the UNET the executing thread is sampling with
+            model_options["initial_device"] = comfy.model_management.text_encoder_offload_device()
         
         try:
-            clip_model = comfy.sd.load_text_encoder_state_dicts(clip_data, 
-            embedding_directory=os.path.join(full_path, "embeddings"), clip_type=clip_type_enum)
+            with LoadTelemetry.span("build", component="clip"):
+                clip_model = comfy.sd.load_text_encoder_state_dicts(clip_data, 
+                embedding_directory=os.path.join(job["full_path"], "embeddings"), clip_type=job["clip_type_enum"],
+                model_options=model_options)
         except Exception as e:
             print(f"DiffusersClipLoader: Error loading clip model: {e}")
             raise
@@ -91,7 +127,7 @@ class DiffusersClipLoader(DiffusersLoaderBase):
         del clip_data
         torch.cuda.empty_cache()
 
-        return clip_model
+        return DiffusersUtils.cache_model(job["cache_key"], clip_model)
     
     @staticmethod 
     def get_clip_type_enum(clip_type):
@@ -107,56 +143,51 @@ class DiffusersClipLoader(DiffusersLoaderBase):
         return clip_type_map.get(clip_type, comfy.sd.CLIPType.STABLE_DIFFUSION)
     
     @classmethod
-    def get_text_encoder_paths(cls, full_path, model_type):
+    def get_text_encoder_paths(cls, full_path, model_type, variant="auto"):
         text_encoder_paths = []
         
         if model_type in ["SDXL", "SD3", "Flux"]:
             text_encoder_dir1 = os.path.join(full_path, "text_encoder")
             text_encoder_dir2 = os.path.join(full_path, "text_encoder_2")
             
-            text_encoder_paths.append(DiffusersUtils.find_model_file(text_encoder_dir1))
+            text_encoder_paths.append(DiffusersUtils.find_model_file(text_encoder_dir1, variant))
             
             if model_type == "Flux":
                 # use the index file
-                index_files = [f for f in os.listdir(text_encoder_dir2) if f.endswith('index.json')]
-                if index_files:
-                    text_encoder_paths.append(os.path.join(text_encoder_dir2, index_files[0]))
+                index_file = DiffusersUtils.find_index_file(text_encoder_dir2, variant)
+                if index_file:
+                    text_encoder_paths.append(index_file)
                 else:
                     print(f"No index file found in {text_encoder_dir2}. Checking for combined text encoder step")
-                    text_encoder_paths.append(DiffusersUtils.find_model_file(text_encoder_dir2))
+                    text_encoder_paths.append(DiffusersUtils.find_model_file(text_encoder_dir2, variant))
             else:
-                text_encoder_paths.append(DiffusersUtils.find_model_file(text_encoder_dir2))
+                text_encoder_paths.append(DiffusersUtils.find_model_file(text_encoder_dir2, variant))
             
             if model_type == "SD3":
                 text_encoder_dir3 = os.path.join(full_path, "text_encoder_3")
                 
-                #For text_encoder_3, we will use the index file
-                index_file = os.path.join(text_encoder_dir3, "text_encoder_3_model.safetensors.index.fp16.json")
-                if os.path.exists(index_file):
-                    text_encoder_paths.append(cls.load_sd3_text_encoder_3(index_file))
+                #For text_encoder_3, we will use the index file (the fp16 one, unless variant or DIFFUSERS_LOADER_VARIANTS says otherwise)
+                index_file = DiffusersUtils.find_index_file(text_encoder_dir3, variant)
+                if index_file:
+                    text_encoder_paths.append(index_file)
                 else:
                     #If index file not found
-                    text_encoder_paths.append(DiffusersUtils.find_model_file(text_encoder_dir3))
+                    text_encoder_paths.append(DiffusersUtils.find_model_file(text_encoder_dir3, variant))
         
         else: #For SD15 or other single text encoder models
             text_encoder_dir = os.path.join(full_path, "text_encoder")
-            text_encoder_paths = [DiffusersUtils.find_model_file(text_encoder_dir)]
+            text_encoder_paths = [DiffusersUtils.find_model_file(text_encoder_dir, variant)]
         
         return text_encoder_paths
     
+    @staticmethod
+    def is_sd3_text_encoder_3_index(path):
+        return path.endswith('.json') and os.path.basename(os.path.dirname(path)) == "text_encoder_3"
+
     @classmethod
     def load_sd3_text_encoder_3(cls, index_file):
-        with open(index_file, 'r') as f:
-            index_data = json.load(f)
-            
-        weight_map = index_data['weight_map']
-        base_path = os.path.dirname(index_file)
-        
-        sd = {}
-        for key, file_name in weight_map.items():
-            file_path = os.path.join(base_path, file_name)
-            if os.path.exists(file_path):
-                part_sd = comfy.utils.load_torch_file(file_path, safe_load=True)
-                sd.update({key: part_sd[key] for key in part_sd if key in weight_map})
-        
-        return sd
\ No newline at end of file
+        # Only the T5 encoder is used; shards or tensors belonging to anything else (e.g. a decoder) are not read
+        compiled_path = DiffusersUtils.find_compiled(index_file)
+        if compiled_path is not None:
+            return DiffusersUtils.load_state_dict(compiled_path, key_prefixes=cls.T5_ENCODER_KEY_PREFIXES)
+        return DiffusersUtils.load_sharded_checkpoint(index_file, skip_missing=True, lazy=MMAP_LOADING, key_prefixes=cls.T5_ENCODER_KEY_PREFIXES)
@@ -4,7 +4,10 @@ from .unet_loader import DiffusersUNETLoader
 from .clip_loader import DiffusersClipLoader
 from .vae_loader import DiffusersVAELoader
 from .base_loader import DiffusersLoaderBase
-import os
+from .loader_config import COMPONENT_LOAD_WORKERS
+from .telemetry import LoadTelemetry
+from .memory_planner import MemoryPlanner
+from concurrent.futures import ThreadPoolExecutor
 
 class CombinedDiffusersLoader:
     @classmethod
@@ -17,7 +20,11 @@ class CombinedDiffusersLoader:
                 "clip_type": (["stable_diffusion", "stable_cascade", "sd3", "stable_audio", "sdxl", "flux"],),
                 "transformer_parts": (["all", "part_1", "part_2", "part_3"],),
                 "vae_type": (["default", "taesd", "taesdxl", "taesd3", "taef1"],),
-                "weight_dtype": (["default", "fp8_e4m3fn", "fp8_e5m2"],)
+                "weight_dtype": (["default", "fp8_e4m3fn", "fp8_e5m2", "auto"],)
+            },
+            "optional": {
+                "concurrent_loading": ("BOOLEAN", {"default": False}),
+                "variant": (DiffusersUtils.WEIGHT_VARIANT_CHOICES,),
             }
         }
 
@@ -26,28 +33,82 @@ class CombinedDiffusersLoader:
     CATEGORY = "DiffusersLoader/Combined"
 
     @classmethod
-    def load_models(cls, sub_directory, clip_type="stable_diffusion", transformer_parts="all", vae_type="default", weight_dtype="default"):
-        
-        model_directories = DiffusersUtils.get_model_directories()
-        _, unique_names = DiffusersUtils.get_unique_display_names(model_directories)
-        
-        if "(" in sub_directory:
-            dir_name, index = sub_directory.rsplit(" (", 1)
-            index = int(index[:-1]) - 1
-            full_path = unique_names[dir_name][index]
-        else:
-            full_path = unique_names[sub_directory][0]
-        
-        if not os.path.exists(full_path):
-            raise ValueError(f"Model directory '{full_path}' not found.")        
+    def load_models(cls, sub_directory, clip_type="stable_diffusion", transformer_parts="all", vae_type="default", weight_dtype="default", concurrent_loading=False, variant="auto"):
+        key = DiffusersLoaderBase.load_key("combined", sub_directory, clip_type, transformer_parts, vae_type, weight_dtype, variant)
+        return DiffusersLoaderBase.load_shared(key, lambda: cls._load_models(sub_directory, clip_type, transformer_parts, vae_type, weight_dtype, concurrent_loading, variant))
 
-        unet_model, = DiffusersUNETLoader.load_model(full_path, transformer_parts, weight_dtype)
+    @classmethod
+    def load_async(cls, sub_directory, clip_type="stable_diffusion", transformer_parts="all", vae_type="default", weight_dtype="default", concurrent_loading=False, variant="auto", on_prepared=None):
+        # Future for the (MODEL, CLIP, VAE) bundle, loaded on the background pool while the executor runs other nodes.
+        # A node that executes while it is still loading waits for it; use asyncio.wrap_future to await it from a coroutine.
+        # on_prepared({cache_key: estimated bytes}) is called before any weights are read, with sizes from the weight
+        # headers, unless the same load was already in flight.
+        key = DiffusersLoaderBase.load_key("combined", sub_directory, clip_type, transformer_parts, vae_type, weight_dtype, variant)
+        return DiffusersLoaderBase.submit_shared(key, lambda: cls._load_models(sub_directory, clip_type, transformer_parts, vae_type, weight_dtype, concurrent_loading, variant, on_prepared))
 
-        clip_model = DiffusersClipLoader.load_model(full_path, clip_type)
-        
-        vae_model = DiffusersVAELoader.load_model(full_path, vae_type)
+    @classmethod
+    def _load_models(cls, sub_directory, clip_type="stable_diffusion", transformer_parts="all", vae_type="default", weight_dtype="default", concurrent_loading=False, variant="auto", on_prepared=None):
+        with LoadTelemetry.load("combined", sub_directory):
+            # Resolved once and shared, so the component loaders do not repeat path resolution or type detection
+            model = DiffusersLoaderBase.resolve(sub_directory)
+
+            plan = None
+            if weight_dtype == "auto":
+                # Dtype, concurrency and load order are decided from the weight headers before any read
+                plan = MemoryPlanner.plan(cls.component_paths(model, clip_type, transformer_parts, vae_type, variant), "auto", concurrent_loading)
+                print("CombinedDiffusersLoader: Memory plan:\n" + MemoryPlanner.format_report(plan))
+                concurrent_loading = plan["concurrent"]
+
+            jobs = {
+                "unet": (DiffusersUNETLoader, DiffusersUNETLoader.prepare_load(model, transformer_parts, weight_dtype, plan, variant)),
+                "clip": (DiffusersClipLoader, DiffusersClipLoader.prepare_load(model, clip_type, variant)),
+                "vae": (DiffusersVAELoader, DiffusersVAELoader.prepare_load(model, vae_type, variant)),
+            }
+            order = plan["order"] if plan is not None else list(jobs)
+            if on_prepared is not None:
+                sizes = plan if plan is not None else MemoryPlanner.plan(cls.component_paths(model, clip_type, transformer_parts, vae_type, variant), weight_dtype)
+                on_prepared({job["cache_key"]: sizes["components"][name]["load_bytes"]
+                             for name, (_, job) in jobs.items() if job["cache_key"] is not None})
+
+            if not concurrent_loading:
+                results = {name: cls.load_component(*jobs[name]) for name in order}
+                return tuple(results[name] for name in jobs)
+
+            # Read and deserialize the components' weights concurrently; comfy objects are still built one at a time, in order
+            pending = [(loader, job) for loader, job in jobs.values() if job["cached"] is None]
+            with ThreadPoolExecutor(max_workers=max(1, min(COMPONENT_LOAD_WORKERS, len(pending)))) as executor:
+                futures = {id(job): executor.submit(LoadTelemetry.wrap(loader.read_state_dict), job) for loader, job in pending}
+                return tuple(cls.load_component(loader, job, futures.pop(id(job), None)) for loader, job in jobs.values())
+
+    @classmethod
+    def prefetch(cls, sub_directory, clip_type="stable_diffusion", transformer_parts="all", vae_type="default", weight_dtype="default", concurrent_loading=False, variant="auto"):
+        # Queues the files of all three components for background page-cache warming, UNET first
+        model = DiffusersLoaderBase.resolve(sub_directory)
+        return (DiffusersUNETLoader.prefetch(model, transformer_parts, weight_dtype, variant)
+                + DiffusersClipLoader.prefetch(model, clip_type, variant)
+                + DiffusersVAELoader.prefetch(model, vae_type, variant))
+
+    @classmethod
+    def IS_CHANGED(cls, sub_directory, clip_type="stable_diffusion", transformer_parts="all", vae_type="default", weight_dtype="default", concurrent_loading=False, variant="auto"):
+        model = DiffusersLoaderBase.resolve(sub_directory)
+        paths = cls.component_paths(model, clip_type, transformer_parts, vae_type, variant)
+        return DiffusersUtils.fingerprint_files(paths["unet"] + paths["clip"] + paths["vae"])
+
+    @staticmethod
+    def component_paths(model, clip_type="stable_diffusion", transformer_parts="all", vae_type="default", variant="auto"):
+        return {
+            "unet": DiffusersUNETLoader.weight_paths(model, transformer_parts, variant=variant),
+            "clip": DiffusersClipLoader.weight_paths(model, clip_type, variant=variant),
+            "vae": DiffusersVAELoader.weight_paths(model, vae_type, variant=variant),
+        }
 
-        return unet_model, clip_model, vae_model
+    @staticmethod
+    def load_component(loader, job, future=None):
+        if job["cached"] is not None:
+            return job["cached"]
+        if future is None:
+            return loader.build_model(job, loader.read_state_dict(job))
+        return loader.build_model(job, future.result())
 
 # Ensure the node is registered properly
 NODE_CLASS_MAPPINGS = {"CombinedDiffusersLoader": CombinedDiffusersLoader}
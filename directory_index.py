@@ -0,0 +1,155 @@
+# directory_index.py
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .loader_config import CACHE_DIR, DIRECTORY_INDEX_TTL, DISCOVERY_WORKERS
+
+class ModelDirectoryIndex:
+    INDEX_PATH = os.path.join(CACHE_DIR, "directory_index.json")
+    # path -> {"mtime": st_mtime_ns, "root": contains model_index.json, "children": sub directory names}
+    _nodes = None
+    _results = {}
+    _reported_cycles = set()
+    _lock = threading.RLock()
+
+    @classmethod
+    def _load(cls):
+        if cls._nodes is None:
+            try:
+                with open(cls.INDEX_PATH, 'r') as f:
+                    cls._nodes = json.load(f)
+            except (OSError, ValueError):
+                cls._nodes = {}
+        return cls._nodes
+
+    @classmethod
+    def _save(cls):
+        try:
+            os.makedirs(os.path.dirname(cls.INDEX_PATH), exist_ok=True)
+            tmp_path = f"{cls.INDEX_PATH}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(cls._nodes, f)
+            os.replace(tmp_path, cls.INDEX_PATH)
+        except OSError as e:
+            print(f"ModelDirectoryIndex: Could not persist directory index: {e}")
+
+    @classmethod
+    def _scan_directory(cls, path):
+        # Runs on the discovery pool. Unchanged directories are trusted from the index; a directory whose mtime moved
+        # is listed again with os.scandir, whose entry types come from the listing itself instead of a stat per entry.
+        # Returns (node, (st_dev, st_ino), changed), or None when the directory cannot be read.
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        directory_id = (stat.st_dev, stat.st_ino)
+        node = cls._nodes.get(path)
+        if node is not None and node["mtime"] == stat.st_mtime_ns:
+            return node, directory_id, False
+        try:
+            with os.scandir(path) as entries:
+                entries = list(entries)
+        except OSError:
+            return None
+        if any(entry.name == "model_index.json" for entry in entries):
+            # A model root: its unet/, transformer/, text_encoder/ ... folders are never descended into
+            return {"mtime": stat.st_mtime_ns, "root": True, "children": []}, directory_id, True
+        children = sorted(entry.name for entry in entries if cls._is_directory(entry))
+        return {"mtime": stat.st_mtime_ns, "root": False, "children": children}, directory_id, True
+
+    @staticmethod
+    def _is_directory(entry):
+        try:
+            return entry.is_dir()
+        except OSError:
+            return False
+
+    @classmethod
+    def _scan(cls, base_paths):
+        # Lists all base paths and their subtrees level by level on a thread pool, so slow (network) mounts are
+        # waited on concurrently. A directory that is also one of its own ancestors (a symlink cycle) is skipped.
+        visited, directory_ids = {}, {}
+        changed = False
+        frontier = [(base_path, ()) for base_path in base_paths if os.path.exists(base_path)]
+        workers = max(1, DISCOVERY_WORKERS)
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="DiffusersLoaderDiscovery") if workers > 1 else None
+        try:
+            while frontier:
+                pending = [(path, ancestors) for path, ancestors in frontier if path not in visited]
+                paths = list(dict.fromkeys(path for path, _ in pending))
+                if executor is None:
+                    results = dict(zip(paths, map(cls._scan_directory, paths)))
+                else:
+                    results = dict(zip(paths, executor.map(cls._scan_directory, paths)))
+                frontier = []
+                for path, ancestors in pending:
+                    result = results[path]
+                    if result is None:
+                        continue
+                    node, directory_id, node_changed = result
+                    if directory_id in ancestors:
+                        if path not in cls._reported_cycles:
+                            cls._reported_cycles.add(path)
+                            print(f"ModelDirectoryIndex: Skipping {path}, a symlink back to one of its parent directories")
+                        continue
+                    if path in visited:
+                        continue
+                    visited[path] = node
+                    directory_ids[path] = directory_id
+                    changed = changed or node_changed
+                    for child in node["children"]:
+                        frontier.append((os.path.join(path, child), ancestors + (directory_id,)))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return visited, directory_ids, changed
+
+    @classmethod
+    def _collect_roots(cls, path, visited, directory_ids, ancestors, roots):
+        # Depth-first over the scanned nodes in sorted order, so the result (and with it the "(1)"/"(2)" display
+        # name numbering) does not depend on which directory listing finished first
+        node = visited.get(path)
+        if node is None or directory_ids[path] in ancestors:
+            return
+        if node["root"]:
+            roots.append(path)
+            return
+        ancestors = ancestors + (directory_ids[path],)
+        for child in node["children"]:
+            cls._collect_roots(os.path.join(path, child), visited, directory_ids, ancestors, roots)
+
+    @classmethod
+    def get_model_directories(cls, base_paths):
+        with cls._lock:
+            cache_key = tuple(base_paths)
+            cached = cls._results.get(cache_key)
+            if cached is not None and time.monotonic() - cached[0] < DIRECTORY_INDEX_TTL:
+                return list(cached[1])
+
+            cls._load()
+            visited, directory_ids, changed = cls._scan(base_paths)
+            paths = []
+            for base_path in base_paths:
+                roots = []
+                cls._collect_roots(base_path, visited, directory_ids, (), roots)
+                for root in roots:
+                    relative_path = os.path.relpath(root, start=base_path)
+                    full_path = os.path.join(base_path, relative_path)
+                    dir_name = os.path.basename(relative_path)
+                    paths.append((dir_name, full_path))
+
+            if changed or len(visited) != len(cls._nodes):
+                # Drop directories that are no longer reachable so the persisted index does not grow forever
+                cls._nodes = visited
+                cls._save()
+            cls._results[cache_key] = (time.monotonic(), paths)
+            return list(paths)
+
+    @classmethod
+    def invalidate(cls):
+        with cls._lock:
+            cls._nodes = {}
+            cls._results = {}
+            cls._save()
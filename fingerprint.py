@@ -0,0 +1,214 @@
+# fingerprint.py
+import os
+import json
+import atexit
+import hashlib
+import threading
+from .safetensors_header import SafetensorsHeader
+from .loader_config import CACHE_DIR
+
+class ModelFingerprint:
+    STORE_PATH = os.path.join(CACHE_DIR, "fingerprints.json")
+    # sampled_digest reads this many bytes from the start of every tensor (or of SAMPLE_BLOCKS spots in other files)
+    SAMPLE_BYTES = 4096
+    SAMPLE_BLOCKS = 64
+    # New records are written out together this many seconds after the first of them, instead of one rewrite each
+    SAVE_DELAY_SECONDS = 5.0
+    _store = None
+    _lock = threading.RLock()
+    _save_lock = threading.Lock()
+    _save_timer = None
+
+    @staticmethod
+    def stat_signature(path):
+        st = os.stat(path)
+        return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+    @classmethod
+    def _load_store(cls):
+        if cls._store is None:
+            try:
+                with open(cls.STORE_PATH, 'r') as f:
+                    cls._store = json.load(f)
+            except (OSError, ValueError):
+                cls._store = {}
+        return cls._store
+
+    @classmethod
+    def _save_store(cls):
+        # Serialized under the lock, written outside it so lookups are not held up by the disk
+        with cls._lock:
+            data = json.dumps(cls._store if cls._store is not None else {})
+        with cls._save_lock:
+            try:
+                os.makedirs(os.path.dirname(cls.STORE_PATH), exist_ok=True)
+                tmp_path = f"{cls.STORE_PATH}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    f.write(data)
+                os.replace(tmp_path, cls.STORE_PATH)
+            except OSError as e:
+                print(f"ModelFingerprint: Could not persist fingerprint cache: {e}")
+
+    @classmethod
+    def _schedule_save(cls):
+        with cls._lock:
+            if cls._save_timer is None:
+                cls._save_timer = threading.Timer(cls.SAVE_DELAY_SECONDS, cls.flush)
+                cls._save_timer.daemon = True
+                cls._save_timer.start()
+
+    @classmethod
+    def flush(cls):
+        # Writes out records that are still waiting for the delayed save
+        with cls._lock:
+            timer, cls._save_timer = cls._save_timer, None
+        if timer is not None:
+            timer.cancel()
+            cls._save_store()
+
+    @classmethod
+    def _get_record(cls, path):
+        # Returns the stored record for path, dropping it if the file changed since it was written
+        path = os.path.abspath(path)
+        signature = cls.stat_signature(path)
+        store = cls._load_store()
+        record = store.get(path)
+        if record is None or record["stat"] != signature:
+            record = {"stat": signature, "header": None, "content": None, "sampled": None}
+            store[path] = record
+        return path, record
+
+    @staticmethod
+    def header_digest(path):
+        if not path.endswith(".safetensors"):
+            return None
+        _, header_bytes = SafetensorsHeader.read_raw(path)
+        return hashlib.sha256(header_bytes).hexdigest()
+
+    @staticmethod
+    def index_shards(index_path):
+        with open(index_path, 'r') as f:
+            weight_map = json.load(f)['weight_map']
+        base_path = os.path.dirname(index_path)
+        return [os.path.join(base_path, file_name) for file_name in sorted(set(weight_map.values()))]
+
+    @classmethod
+    def file_fingerprint(cls, path):
+        with cls._lock:
+            path, record = cls._get_record(path)
+            if record["header"] is None:
+                record["header"] = cls.header_digest(path) or ""
+                cls._schedule_save()
+            key = json.dumps([path, record["stat"], record["header"]])
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    @classmethod
+    def get(cls, path):
+        # Cheap change detection: (path, size, mtime_ns, inode) plus the safetensors header.
+        # An index.json fingerprint also covers every shard it references.
+        if path.endswith(".json"):
+            parts = [cls.file_fingerprint(path)]
+            parts.extend(cls.file_fingerprint(shard) for shard in cls.index_shards(path) if os.path.exists(shard))
+            return hashlib.sha256("".join(parts).encode()).hexdigest()
+        return cls.file_fingerprint(path)
+
+    @classmethod
+    def content_hash(cls, path):
+        # Full read of the file; only runs when explicitly requested and is remembered until the file changes
+        if path.endswith(".json"):
+            parts = [cls.content_hash(shard) for shard in cls.index_shards(path) if os.path.exists(shard)]
+            return hashlib.sha256("".join(parts).encode()).hexdigest()
+
+        with cls._lock:
+            path, record = cls._get_record(path)
+            if record["content"] is not None:
+                return record["content"]
+
+        file_hash = hashlib.sha256()
+        with open(path, 'rb') as f:
+            chunk = f.read(1024 * 1024)
+            while chunk:
+                file_hash.update(chunk)
+                chunk = f.read(1024 * 1024)
+
+        with cls._lock:
+            path, record = cls._get_record(path)
+            record["content"] = file_hash.hexdigest()
+            cls._schedule_save()
+            return record["content"]
+
+    @classmethod
+    def known_content_hash(cls, path):
+        # content_hash if it was already computed for the current version of the file, otherwise None; reads no data
+        if path.endswith(".json"):
+            parts = [cls.known_content_hash(shard) for shard in cls.index_shards(path) if os.path.exists(shard)]
+            return None if None in parts else hashlib.sha256("".join(parts).encode()).hexdigest()
+
+        with cls._lock:
+            path, record = cls._get_record(path)
+            return record["content"]
+
+    @classmethod
+    def known_sampled_digest(cls, path):
+        # sampled_digest if it was already computed for the current version of the file, otherwise None; reads no data
+        if path.endswith(".json"):
+            parts = [cls.known_sampled_digest(shard) for shard in cls.index_shards(path) if os.path.exists(shard)]
+            return None if None in parts else hashlib.sha256("".join(parts).encode()).hexdigest()
+
+        with cls._lock:
+            path, record = cls._get_record(path)
+            return record.get("sampled")
+
+    @classmethod
+    def sampled_digest(cls, path):
+        # Content-addressed identity: unlike get(), identical weights at different paths give the same digest.
+        # Built from the safetensors header and a sample of every tensor's data, remembered until the file changes.
+        if path.endswith(".json"):
+            parts = [cls.sampled_digest(shard) for shard in cls.index_shards(path) if os.path.exists(shard)]
+            return hashlib.sha256("".join(parts).encode()).hexdigest()
+
+        with cls._lock:
+            path, record = cls._get_record(path)
+            if record.get("sampled") is not None:
+                return record["sampled"]
+
+        digest = cls._sample_file(path)
+
+        with cls._lock:
+            path, record = cls._get_record(path)
+            record["sampled"] = digest
+            cls._schedule_save()
+            return digest
+
+    @classmethod
+    def _sample_file(cls, path):
+        file_hash = hashlib.sha256()
+        with open(path, 'rb') as f:
+            if path.endswith(".safetensors"):
+                header_size, header_bytes = SafetensorsHeader.read_raw(path)
+                file_hash.update(header_bytes)
+                header = json.loads(header_bytes)
+                header.pop("__metadata__", None)
+                data_start = 8 + header_size
+                # In file order, so the reads only move forward through the file
+                for start, end in sorted(tuple(info["data_offsets"]) for info in header.values()):
+                    f.seek(data_start + start)
+                    file_hash.update(f.read(min(cls.SAMPLE_BYTES, end - start)))
+            else:
+                size = os.path.getsize(path)
+                file_hash.update(str(size).encode())
+                for block in range(cls.SAMPLE_BLOCKS):
+                    f.seek(size * block // cls.SAMPLE_BLOCKS)
+                    file_hash.update(f.read(cls.SAMPLE_BYTES))
+        return file_hash.hexdigest()
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._store = {}
+            timer, cls._save_timer = cls._save_timer, None
+        if timer is not None:
+            timer.cancel()
+        cls._save_store()
+
+atexit.register(ModelFingerprint.flush)
@@ -0,0 +1,83 @@
+# lazy_state_dict.py
+import os
+from collections.abc import MutableMapping
+from safetensors import safe_open
+
+class LazyStateDict(MutableMapping):
+    # A state dict whose tensors stay in their memory-mapped safetensors files until they are looked up.
+    # Values assigned by the consumer (e.g. comfy's key conversions) are kept in memory as usual.
+    _FILE = object()
+
+    def __init__(self, sources, transform=None):
+        # sources: tensor key -> safetensors file path, in the order the keys should be iterated.
+        # transform is applied to every tensor read from a file (e.g. a streaming dtype cast).
+        self._entries = {key: (self._FILE, file_path) for key, file_path in sources.items()}
+        self._handles = {}
+        self._transform = transform
+
+    @classmethod
+    def from_file(cls, file_path, transform=None):
+        state_dict = cls({}, transform=transform)
+        handle = state_dict._open(file_path)
+        state_dict._entries = {key: (cls._FILE, file_path) for key in handle.keys()}
+        return state_dict
+
+    @classmethod
+    def from_shards(cls, shards, skip_missing=False, transform=None):
+        # shards: list of (file path, tensor keys); builds a single view over all of them without reading any data
+        state_dict = cls({}, transform=transform)
+        for file_path, keys in shards:
+            available = set(state_dict._open(file_path).keys())
+            missing = [key for key in keys if key not in available]
+            if missing and not skip_missing:
+                raise KeyError(f"{len(missing)} tensor(s) listed in the index are missing from {file_path}, e.g. '{missing[0]}'")
+            for key in keys:
+                if key in available:
+                    state_dict._entries[key] = (cls._FILE, file_path)
+        return state_dict
+
+    def _open(self, file_path):
+        handle = self._handles.get(file_path)
+        if handle is None:
+            handle = safe_open(file_path, framework="pt", device="cpu")
+            self._handles[file_path] = handle
+        return handle
+
+    def __getitem__(self, key):
+        kind, value = self._entries[key]
+        if kind is self._FILE:
+            tensor = self._open(value).get_tensor(key)
+            return self._transform(tensor) if self._transform is not None else tensor
+        return value
+
+    def __setitem__(self, key, value):
+        self._entries[key] = (None, value)
+
+    def __delitem__(self, key):
+        del self._entries[key]
+
+    def __iter__(self):
+        return iter(list(self._entries))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def set_transform(self, transform):
+        # Used for tensors read from now on; tensors already held in memory are transformed right away
+        self._transform = transform
+        if transform is not None:
+            for key, (kind, value) in list(self._entries.items()):
+                if kind is not self._FILE:
+                    self._entries[key] = (None, transform(value))
+
+    def files(self):
+        return sorted({value for kind, value in self._entries.values() if kind is self._FILE})
+
+    def close(self):
+        self._handles.clear()
+
+    def __repr__(self):
+        return f"LazyStateDict({len(self._entries)} tensors from {[os.path.basename(f) for f in self.files()]})"
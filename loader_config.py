@@ -0,0 +1,76 @@
+# loader_config.py
+import os
+
+# Directory used for the on-disk caches kept by this node pack (fingerprints etc.)
+CACHE_DIR = os.environ.get(
+    "DIFFUSERS_LOADER_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"),
+)
+
+def _default_cache_ram_mb():
+    # A quarter of the machine's physical RAM, so cached checkpoints never crowd out the models comfy is sampling with
+    try:
+        total_bytes = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return 4096
+    return max(0, total_bytes // 4 // (1024 * 1024))
+
+# Budgets for the in-process cache of loaded MODEL/CLIP/VAE objects, in MB.
+# 0 disables caching for that budget's device class, a negative value means unlimited.
+MODEL_CACHE_RAM_MB = int(os.environ.get("DIFFUSERS_LOADER_CACHE_RAM_MB", str(_default_cache_ram_mb())))
+MODEL_CACHE_VRAM_MB = int(os.environ.get("DIFFUSERS_LOADER_CACHE_VRAM_MB", "-1"))
+MODEL_CACHE_MAX_ENTRIES = int(os.environ.get("DIFFUSERS_LOADER_CACHE_MAX_ENTRIES", "8"))
+
+# Seconds a validated model-directory listing is reused before directory mtimes are checked again
+DIRECTORY_INDEX_TTL = float(os.environ.get("DIFFUSERS_LOADER_INDEX_TTL", "2"))
+
+# Threads that list model directories during discovery, across all base paths at once; 1 scans without a pool
+DISCOVERY_WORKERS = int(os.environ.get("DIFFUSERS_LOADER_DISCOVERY_WORKERS", "8"))
+
+# Thread pool size used when CombinedDiffusersLoader reads the UNET, CLIP and VAE weights concurrently
+COMPONENT_LOAD_WORKERS = int(os.environ.get("DIFFUSERS_LOADER_COMPONENT_WORKERS", "3"))
+
+# Number of shards of an index.json checkpoint that are read in parallel; 1 reads them one after another
+SHARD_READ_WORKERS = int(os.environ.get("DIFFUSERS_LOADER_SHARD_WORKERS", "4"))
+
+# Load safetensors weights as lazy, memory-mapped state dicts instead of materializing them in RAM up front
+MMAP_LOADING = os.environ.get("DIFFUSERS_LOADER_MMAP", "0") == "1"
+
+# Where CheckpointCompiler writes consolidated single-file checkpoints and their manifests
+COMPILED_DIR = os.environ.get("DIFFUSERS_LOADER_COMPILED_DIR", os.path.join(CACHE_DIR, "compiled"))
+
+# Prefetch the weight files of the loader nodes in a prompt into the OS page cache as soon as it is queued
+PREFETCH_ON_QUEUE = os.environ.get("DIFFUSERS_LOADER_PREFETCH", "0") == "1"
+
+# Bandwidth cap for prefetching, in MB/s; 0 or less prefetches as fast as the disk allows
+PREFETCH_MAX_MBPS = float(os.environ.get("DIFFUSERS_LOADER_PREFETCH_MBPS", "0"))
+
+# Strategies tried in order when building the UNET runs out of memory, reusing the state dict that was already read:
+# retry (free comfy's loaded models and retry), fp8 (cast the weights to fp8_e4m3fn). Where the built model is placed
+# is left to comfy, which offloads what does not fit in VRAM (lowvram) when sampling.
+OOM_RECOVERY_TIERS = [tier.strip() for tier in os.environ.get("DIFFUSERS_LOADER_OOM_TIERS", "retry,fp8").split(",") if tier.strip()]
+
+# Key cached CLIP and VAE components by a sampled content digest of their weights instead of their checkpoint directory,
+# so fine-tunes that ship identical text encoders or VAEs share one loaded copy
+SHARE_COMPONENTS = os.environ.get("DIFFUSERS_LOADER_SHARE_COMPONENTS", "1") == "1"
+
+# Threads that run load_async/background loads; 1 keeps at most one queued-ahead load reading at a time
+ASYNC_LOAD_WORKERS = int(os.environ.get("DIFFUSERS_LOADER_ASYNC_WORKERS", "1"))
+
+# Check safetensors headers, index weight_maps and component folders of every discovered checkpoint (in the background)
+# and of the chosen weight files before each load, so incomplete downloads fail before any tensor data is read
+VALIDATE_CHECKPOINTS = os.environ.get("DIFFUSERS_LOADER_VALIDATE", "1") == "1"
+
+# Preference order of weight file precision variants when a component folder ships several, e.g.
+# diffusion_pytorch_model.fp16.safetensors next to diffusion_pytorch_model.safetensors; "default" is the untagged file.
+# safetensors files always rank before pickled .bin files, whatever their variant.
+WEIGHT_VARIANTS = [variant.strip() for variant in os.environ.get("DIFFUSERS_LOADER_VARIANTS", "fp16,bf16,default,fp32").split(",") if variant.strip()]
+
+# Share of the currently free host RAM and the total VRAM the memory planner lets a load use (weight_dtype "auto" and the
+# memory plan report); the rest is left for activations, other models and the OS
+MEMORY_PLAN_HEADROOM = float(os.environ.get("DIFFUSERS_LOADER_MEMORY_HEADROOM", "0.85"))
+
+# Budget for the cache entries pinned by the warm pool, in MB (RAM + VRAM); defaults to the RAM cache budget.
+# Pinned entries are never evicted to make room and do not count against the cache limits above, so this bounds
+# how much memory they can hold on top of them. -1 explicitly opts out of the bound.
+WARM_POOL_PIN_MB = int(os.environ.get("DIFFUSERS_LOADER_PIN_MB", str(MODEL_CACHE_RAM_MB)))
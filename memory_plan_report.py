@@ -0,0 +1,53 @@
+# memory_plan_report.py
+from .utils import DiffusersUtils
+from .base_loader import DiffusersLoaderBase
+from .combined_diffusers_loader import CombinedDiffusersLoader
+from .memory_planner import MemoryPlanner
+
+class DiffusersMemoryPlanReport:
+    # Dry run of CombinedDiffusersLoader: reports what the given inputs would load and whether it fits, reading only
+    # weight headers. The plan for weight_dtype "auto" is the one the combined loader would use right now.
+    @classmethod
+    def INPUT_TYPES(cls):
+        display_names, _ = DiffusersUtils.get_unique_display_names(DiffusersUtils.get_model_directories())
+
+        return {
+            "required": {
+                "sub_directory": (display_names,),
+                "clip_type": (["stable_diffusion", "stable_cascade", "sd3", "stable_audio", "sdxl", "flux"],),
+                "transformer_parts": (["all", "part_1", "part_2", "part_3"],),
+                "vae_type": (["default", "taesd", "taesdxl", "taesd3", "taef1"],),
+                "weight_dtype": (["auto", "default", "fp8_e4m3fn", "fp8_e5m2"],)
+            },
+            "optional": {
+                "concurrent_loading": ("BOOLEAN", {"default": False}),
+                "variant": (DiffusersUtils.WEIGHT_VARIANT_CHOICES,),
+            }
+        }
+
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("report",)
+    FUNCTION = "report"
+    OUTPUT_NODE = True
+    CATEGORY = "DiffusersLoader/Combined"
+
+    @classmethod
+    def report(cls, sub_directory, clip_type="stable_diffusion", transformer_parts="all", vae_type="default", weight_dtype="auto", concurrent_loading=False, variant="auto"):
+        text = cls.build_report(sub_directory, clip_type, transformer_parts, vae_type, weight_dtype, concurrent_loading, variant)
+        print(f"DiffusersMemoryPlanReport:\n{text}")
+        return {"ui": {"text": [text]}, "result": (text,)}
+
+    @classmethod
+    def build_report(cls, sub_directory, clip_type="stable_diffusion", transformer_parts="all", vae_type="default", weight_dtype="auto", concurrent_loading=False, variant="auto"):
+        model = DiffusersLoaderBase.resolve(sub_directory)
+        paths = CombinedDiffusersLoader.component_paths(model, clip_type, transformer_parts, vae_type, variant)
+        plan = MemoryPlanner.plan(paths, weight_dtype, concurrent_loading)
+        return f"{model.full_path} ({model.model_type})\n" + MemoryPlanner.format_report(plan)
+
+    @classmethod
+    def IS_CHANGED(cls, **kwargs):
+        # Free memory changes between runs, so the report is never reused
+        return float("nan")
+
+NODE_CLASS_MAPPINGS = {"DiffusersMemoryPlanReport": DiffusersMemoryPlanReport}
+NODE_DISPLAY_NAME_MAPPINGS = {"DiffusersMemoryPlanReport": "Diffusers Memory Plan (dry run)"}
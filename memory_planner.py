@@ -0,0 +1,191 @@
+# memory_planner.py
+import os
+import threading
+import torch
+import comfy.model_management
+from .fingerprint import ModelFingerprint
+from .safetensors_header import SafetensorsHeader
+from .checkpoint_validator import CheckpointValidator
+from .loader_config import MEMORY_PLAN_HEADROOM
+
+class MemoryPlanner:
+    # Adds up what a load will need from safetensors headers and index files alone, compares it with the host RAM
+    # that is free right now and the device's total VRAM and, for weight_dtype "auto", picks the UNET dtype and the
+    # order the components are loaded in before any weights are read.
+    FLOAT_DTYPES = {"F64", "F32", "F16", "BF16"}
+    FP8_WEIGHT_DTYPE = "fp8_e4m3fn"
+    _sizes = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def weight_bytes(cls, path):
+        # (bytes as stored, bytes once matrix/conv weights are cast to fp8), cached per fingerprint.
+        # Shards an index lists but that are not on disk are skipped, like the skip_missing loads.
+        if not os.path.exists(path):
+            return 0, 0
+        fingerprint = ModelFingerprint.get(path)
+        key = os.path.abspath(path)
+        with cls._lock:
+            entry = cls._sizes.get(key)
+            if entry is not None and entry[0] == fingerprint:
+                return entry[1]
+
+        if path.endswith(".json"):
+            stored, fp8 = 0, 0
+            for shard in ModelFingerprint.index_shards(path):
+                shard_stored, shard_fp8 = cls.weight_bytes(shard)
+                stored += shard_stored
+                fp8 += shard_fp8
+            sizes = (stored, fp8)
+        elif path.endswith(".safetensors"):
+            sizes = cls.header_bytes(path)
+        else:
+            # Pickled weights have no header to read; their file size is the closest estimate
+            size = os.path.getsize(path)
+            sizes = (size, size)
+
+        with cls._lock:
+            cls._sizes[key] = (fingerprint, sizes)
+        return sizes
+
+    @classmethod
+    def header_bytes(cls, path):
+        # Mirrors DiffusersUtils.cast_tensor: only floating point tensors with two or more dimensions are cast
+        header, _ = SafetensorsHeader.read(path)
+        stored, fp8 = 0, 0
+        for info in header.values():
+            start, end = info["data_offsets"]
+            stored += end - start
+            if info["dtype"] in cls.FLOAT_DTYPES and len(info["shape"]) >= 2:
+                fp8 += (end - start) // CheckpointValidator.DTYPE_SIZES[info["dtype"]]
+            else:
+                fp8 += end - start
+        return stored, fp8
+
+    @staticmethod
+    def available_memory():
+        # (free host RAM, total VRAM) in bytes; VRAM is 0 when comfy runs on the CPU.
+        # Free VRAM would leave out what the models comfy unloads before sampling hold, so the device total is used.
+        try:
+            device = comfy.model_management.get_torch_device()
+            ram = comfy.model_management.get_free_memory(torch.device("cpu"))
+            vram = comfy.model_management.get_total_memory(device) if device.type != "cpu" else 0
+            return int(ram), int(vram)
+        except AttributeError:
+            pass
+
+        ram = 0
+        try:
+            with open("/proc/meminfo", "r") as f:
+                for line in f:
+                    if line.startswith("MemAvailable:"):
+                        ram = int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            try:
+                ram = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+            except (ValueError, OSError, AttributeError):
+                pass
+        vram = torch.cuda.mem_get_info()[1] if torch.cuda.is_available() else 0
+        return ram, vram
+
+    @classmethod
+    def plan(cls, component_paths, weight_dtype="auto", concurrent=False, memory=None):
+        # component_paths: {"unet": [...], "clip": [...], "vae": [...]}, any of them may be left out.
+        # Only "auto" changes anything; for an explicit weight_dtype the plan is a report of what will happen.
+        ram, vram = memory if memory is not None else cls.available_memory()
+        ram_budget, vram_budget = int(ram * MEMORY_PLAN_HEADROOM), int(vram * MEMORY_PLAN_HEADROOM)
+
+        components = {}
+        for name, paths in component_paths.items():
+            stored, fp8 = 0, 0
+            for path in paths:
+                path_stored, path_fp8 = cls.weight_bytes(path)
+                stored += path_stored
+                fp8 += path_fp8
+            components[name] = {"paths": list(paths), "bytes": stored, "fp8_bytes": fp8}
+
+        auto = weight_dtype == "auto"
+        notes = []
+        # Placement is always left to comfy; "offload" only reports that it will load the UNET partially (lowvram)
+        placement = "default"
+        unet = components.get("unet", {"bytes": 0, "fp8_bytes": 0})
+        if auto:
+            # Only the UNET stays resident on the GPU while sampling; comfy moves the text encoders and VAE on demand
+            device_budget = vram_budget if vram > 0 else ram_budget
+            if unet["bytes"] <= device_budget:
+                weight_dtype = "default"
+            elif unet["fp8_bytes"] <= device_budget:
+                weight_dtype = cls.FP8_WEIGHT_DTYPE
+                notes.append(f"UNET needs {cls.format_bytes(unet['bytes'])} at its stored precision, more than the "
+                             f"{cls.format_bytes(device_budget)} budget; casting it to {cls.FP8_WEIGHT_DTYPE}")
+            else:
+                weight_dtype = cls.FP8_WEIGHT_DTYPE
+                if vram > 0:
+                    placement = "offload"
+                    notes.append(f"UNET needs {cls.format_bytes(unet['fp8_bytes'])} even as {cls.FP8_WEIGHT_DTYPE}, more than the "
+                                 f"{cls.format_bytes(vram_budget)} VRAM budget; comfy will offload part of it to host RAM")
+        elif vram > 0 and unet["bytes"] > vram_budget:
+            notes.append(f"UNET needs {cls.format_bytes(unet['bytes'])}, more than the {cls.format_bytes(vram_budget)} VRAM budget; "
+                         f"weight_dtype 'auto' would avoid the out-of-memory retries")
+
+        if "unet" in components:
+            components["unet"]["load_bytes"] = unet["fp8_bytes"] if weight_dtype.startswith("fp8") else unet["bytes"]
+        for name, component in components.items():
+            component.setdefault("load_bytes", component["bytes"])
+
+        # Read state dicts are resident in host RAM until their model is built: all of them at once when loading
+        # concurrently, one at a time otherwise
+        order = list(components)
+        total = sum(component["load_bytes"] for component in components.values())
+        largest = max((component["load_bytes"] for component in components.values()), default=0)
+        if auto and concurrent and total > ram_budget and largest <= ram_budget:
+            notes.append(f"Reading all components at once needs {cls.format_bytes(total)} of host RAM, more than the "
+                         f"{cls.format_bytes(ram_budget)} budget; loading them one at a time, largest first")
+            concurrent = False
+            order = sorted(order, key=lambda name: -components[name]["load_bytes"])
+        peak = total if concurrent else largest
+        if peak > ram_budget:
+            notes.append(f"Loading needs about {cls.format_bytes(peak)} of host RAM but only {cls.format_bytes(ram_budget)} is within budget")
+
+        return {
+            "weight_dtype": weight_dtype,
+            "placement": placement,
+            "concurrent": concurrent,
+            "order": order,
+            "components": components,
+            "ram_available": ram,
+            "vram_available": vram,
+            "ram_budget": ram_budget,
+            "vram_budget": vram_budget,
+            "peak_ram": peak,
+            "fits": peak <= ram_budget and (vram == 0 or placement == "offload" or components.get("unet", {}).get("load_bytes", 0) <= vram_budget),
+            "notes": notes,
+        }
+
+    @staticmethod
+    def format_bytes(size):
+        return f"{size / 1024 ** 3:.2f} GB" if size >= 1024 ** 3 else f"{size / 1024 ** 2:.1f} MB"
+
+    @classmethod
+    def format_report(cls, plan):
+        lines = [
+            f"weight_dtype: {plan['weight_dtype']}",
+            f"UNET placement: {plan['placement']}",
+            f"Load order: {', '.join(plan['order'])} ({'concurrent' if plan['concurrent'] else 'one at a time'})",
+            f"Free host RAM: {cls.format_bytes(plan['ram_available'])} (budget {cls.format_bytes(plan['ram_budget'])})",
+            f"VRAM: {cls.format_bytes(plan['vram_available'])} (budget {cls.format_bytes(plan['vram_budget'])})",
+        ]
+        for name in plan["order"]:
+            component = plan["components"][name]
+            lines.append(f"{name}: {cls.format_bytes(component['load_bytes'])} to load "
+                         f"({cls.format_bytes(component['bytes'])} stored, {len(component['paths'])} file(s))")
+        lines.append(f"Peak host RAM while loading: {cls.format_bytes(plan['peak_ram'])}")
+        lines.append("Fits: yes" if plan["fits"] else "Fits: no")
+        lines.extend(f"Note: {note}" for note in plan["notes"])
+        return "\n".join(lines)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._sizes = {}
@@ -0,0 +1,214 @@
+# model_cache.py
+import itertools
+import threading
+from collections import OrderedDict, namedtuple
+import torch
+from .telemetry import LoadTelemetry
+
+ModelCacheKey = namedtuple(
+    "ModelCacheKey",
+    ["kind", "path", "fingerprint", "weight_dtype", "transformer_parts", "clip_type", "vae_type"],
+    defaults=[None, None, None, None],
+)
+
+class ModelCache:
+    # Attributes under which comfy's MODEL (ModelPatcher), CLIP and VAE objects keep their torch modules
+    MODULE_ATTRIBUTES = ("model", "cond_stage_model", "first_stage_model", "patcher")
+
+    def __init__(self, max_ram_mb=-1, max_vram_mb=-1, max_entries=-1):
+        self.max_ram_bytes = max_ram_mb * 1024 * 1024 if max_ram_mb >= 0 else None
+        self.max_vram_bytes = max_vram_mb * 1024 * 1024 if max_vram_mb >= 0 else None
+        self.max_entries = max_entries if max_entries >= 0 else None
+        self._entries = OrderedDict()
+        # key -> number of pin() calls holding it; pinned entries are never evicted for space and do not count
+        # against max_entries or the byte budgets. A key can be pinned before it is put, with an estimated size
+        # that pin budgets count until the entry is there to be measured.
+        self._pins = {}
+        self._reserved = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def _iter_modules(cls, value, seen, depth=0):
+        if value is None or id(value) in seen or depth > 3:
+            return
+        seen.add(id(value))
+        if isinstance(value, torch.nn.Module):
+            yield value
+            return
+        if isinstance(value, (tuple, list)):
+            for item in value:
+                yield from cls._iter_modules(item, seen, depth + 1)
+            return
+        for attr in cls.MODULE_ATTRIBUTES:
+            yield from cls._iter_modules(getattr(value, attr, None), seen, depth + 1)
+
+    @classmethod
+    def measure(cls, value):
+        # Returns (cpu_bytes, gpu_bytes) held by the parameters and buffers of a cached object
+        ram = vram = 0
+        seen_tensors = set()
+        for module in cls._iter_modules(value, set()):
+            for tensor in itertools.chain(module.parameters(), module.buffers()):
+                if tensor.device.type == "meta":
+                    continue
+                ptr = (tensor.device, tensor.data_ptr())
+                if ptr in seen_tensors:
+                    continue
+                seen_tensors.add(ptr)
+                size = tensor.nelement() * tensor.element_size()
+                if tensor.device.type == "cpu":
+                    ram += size
+                else:
+                    vram += size
+        return ram, vram
+
+    def _fits(self, ram, vram):
+        if self.max_ram_bytes is not None and ram > self.max_ram_bytes:
+            return False
+        if self.max_vram_bytes is not None and vram > self.max_vram_bytes:
+            return False
+        return True
+
+    def usage(self, include_pinned=True):
+        # Re-measured on demand since comfy moves cached models between devices while sampling
+        with self._lock:
+            ram = vram = 0
+            for key, value in self._entries.items():
+                if not include_pinned and key in self._pins:
+                    continue
+                entry_ram, entry_vram = self.measure(value)
+                ram += entry_ram
+                vram += entry_vram
+            return ram, vram
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                # comfy moves cached models between devices while sampling, so the budget is checked again here
+                self._evict()
+                self.hits += 1
+                LoadTelemetry.increment("cache_hits_total", kind=key.kind)
+                print(f"ModelCache: Hit for {key.kind} '{key.path}' (hits: {self.hits}, misses: {self.misses})")
+                return self._entries[key]
+            self.misses += 1
+            LoadTelemetry.increment("cache_misses_total", kind=key.kind)
+            print(f"ModelCache: Miss for {key.kind} '{key.path}' (hits: {self.hits}, misses: {self.misses})")
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            if self.max_entries == 0:
+                return value
+            ram, vram = self.measure(value)
+            if key not in self._pins and not self._fits(ram, vram):
+                print(f"ModelCache: {key.kind} '{key.path}' exceeds the cache budget on its own, not caching it")
+                return value
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._evict()
+            return value
+
+    def _evict(self):
+        while len(self._entries) > 1:
+            unpinned = sum(1 for key in self._entries if key not in self._pins)
+            over_entries = self.max_entries is not None and unpinned > self.max_entries
+            if not over_entries and self._fits(*self.usage(include_pinned=False)):
+                break
+            # Least recently used first, skipping pinned entries and the entry that was just added
+            candidates = [key for key in itertools.islice(self._entries, len(self._entries) - 1) if key not in self._pins]
+            if not candidates:
+                break
+            key = candidates[0]
+            del self._entries[key]
+            self.evictions += 1
+            LoadTelemetry.increment("cache_evictions_total", kind=key.kind)
+            print(f"ModelCache: Evicted least recently used {key.kind} '{key.path}'")
+
+    def evict_where(self, predicate):
+        # Also drops pinned entries: this is how stale versions of changed checkpoints are removed
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+                self._pins.pop(key, None)
+                self._reserved.pop(key, None)
+                self.evictions += 1
+
+    def rekey(self, key, new_key):
+        # Moves an unpinned entry to new_key; pinned entries stay where their pin holders expect them
+        with self._lock:
+            if key not in self._entries or key in self._pins or new_key in self._entries:
+                return False
+            self._entries[new_key] = self._entries.pop(key)
+            self._entries.move_to_end(new_key)
+            return True
+
+    def contains(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def keys_of(self, values):
+        # Cache keys under which these exact objects are stored
+        ids = {id(value) for value in values}
+        with self._lock:
+            self._evict()
+            return [key for key, value in self._entries.items() if id(value) in ids]
+
+    def pin(self, keys, max_bytes=None, sizes=None):
+        # Pins keys unless the pinned set would then hold more than max_bytes (RAM + VRAM). Keys that are not cached
+        # yet are pinned too, so their entries are protected from the moment they are put; until then they count
+        # with their estimated size from sizes. Returns the keys that were pinned; every pin needs a matching unpin.
+        with self._lock:
+            keys = list(keys)
+            sizes = sizes or {}
+            if max_bytes is not None:
+                pinned = set(self._pins).union(keys)
+                if sum(self._pinned_size(key, sizes) for key in pinned) > max_bytes:
+                    return []
+            for key in keys:
+                self._pins[key] = self._pins.get(key, 0) + 1
+                if key in sizes:
+                    self._reserved[key] = sizes[key]
+            return keys
+
+    def _pinned_size(self, key, sizes=None):
+        if key in self._entries:
+            return sum(self.measure(self._entries[key]))
+        return self._reserved.get(key, (sizes or {}).get(key, 0))
+
+    def unpin(self, keys):
+        with self._lock:
+            for key in keys:
+                count = self._pins.get(key, 0) - 1
+                if count > 0:
+                    self._pins[key] = count
+                else:
+                    self._pins.pop(key, None)
+                    self._reserved.pop(key, None)
+            self._evict()
+
+    def pinned_bytes(self):
+        with self._lock:
+            return sum(self._pinned_size(key) for key in self._pins)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._pins.clear()
+            self._reserved.clear()
+
+    def stats(self):
+        with self._lock:
+            ram, vram = self.usage()
+            return {
+                "entries": len(self._entries),
+                "pinned": sum(1 for key in self._pins if key in self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "ram_bytes": ram,
+                "vram_bytes": vram,
+            }
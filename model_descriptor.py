@@ -0,0 +1,52 @@
+# model_descriptor.py
+import os
+import json
+import threading
+
+class ResolvedModel:
+    # Everything the loaders need to know about one diffusers directory, computed once and shared by all loaders.
+    # Weight file choices are memoized per key (e.g. ("unet", "all")) the first time a loader asks for them.
+    def __init__(self, full_path, model_info, signature):
+        self.full_path = full_path
+        self.model_info = model_info
+        self.signature = signature
+        self.model_type = None
+        self.components = {
+            name: os.path.join(full_path, name)
+            for name in sorted(model_info)
+            if not name.startswith("_") and os.path.isdir(os.path.join(full_path, name))
+        }
+        self._weight_files = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def read_model_info(full_path):
+        model_index_path = os.path.join(full_path, "model_index.json")
+        if not os.path.exists(model_index_path):
+            return {}
+        with open(model_index_path, 'r') as f:
+            return json.load(f)
+
+    @staticmethod
+    def signature_of(full_path):
+        # model_index.json plus the directories it may point at; a new or renamed weight file changes a folder mtime
+        signature = []
+        for name in ["model_index.json"] + sorted(os.listdir(full_path)):
+            path = os.path.join(full_path, name)
+            try:
+                signature.append((name, os.stat(path).st_mtime_ns))
+            except OSError:
+                signature.append((name, None))
+        return tuple(signature)
+
+    def folder(self, component):
+        return self.components.get(component, os.path.join(self.full_path, component))
+
+    def weight_file(self, key, resolver):
+        with self._lock:
+            if key not in self._weight_files:
+                self._weight_files[key] = resolver()
+            return self._weight_files[key]
+
+    def __repr__(self):
+        return f"ResolvedModel({self.full_path!r}, model_type={self.model_type!r})"
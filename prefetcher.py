@@ -0,0 +1,151 @@
+# prefetcher.py
+import os
+import time
+import queue
+import threading
+from .telemetry import LoadTelemetry
+from .loader_config import PREFETCH_MAX_MBPS
+
+class ModelPrefetcher:
+    # Warms weight files into the OS page cache on a background thread so a later load reads them from memory.
+    # Tasks run one at a time in submission order; a file that is already queued or being warmed is not queued again.
+    # Idle tasks (submit_idle) run on a second, low-priority thread that only starts one while the prefetch queue is empty.
+    CHUNK_SIZE = 16 * 1024 * 1024
+    IDLE_POLL_SECONDS = 0.5
+    _queue = queue.Queue()
+    _idle_queue = queue.Queue()
+    _pending = set()
+    _lock = threading.Lock()
+    _thread = None
+    _idle_thread = None
+
+    @classmethod
+    def _ensure_worker(cls):
+        with cls._lock:
+            if cls._thread is None or not cls._thread.is_alive():
+                cls._thread = threading.Thread(target=cls._run, name="DiffusersLoaderPrefetch", daemon=True)
+                cls._thread.start()
+
+    @classmethod
+    def submit(cls, key, fn, *args, **kwargs):
+        # Runs fn(*args, **kwargs) on the prefetch thread unless a task with the same key is still pending
+        with cls._lock:
+            if key in cls._pending:
+                return False
+            cls._pending.add(key)
+        cls._queue.put((key, fn, args, kwargs))
+        cls._ensure_worker()
+        return True
+
+    @classmethod
+    def submit_idle(cls, key, fn, *args, **kwargs):
+        # Like submit, for background work no load is waiting on (e.g. full content hashes)
+        with cls._lock:
+            if key in cls._pending:
+                return False
+            cls._pending.add(key)
+            if cls._idle_thread is None or not cls._idle_thread.is_alive():
+                cls._idle_thread = threading.Thread(target=cls._run_idle, name="DiffusersLoaderIdle", daemon=True)
+                cls._idle_thread.start()
+        cls._idle_queue.put((key, fn, args, kwargs))
+        return True
+
+    @classmethod
+    def submit_file(cls, path, max_mbps=None):
+        return cls.submit(("file", os.path.realpath(path)), cls.warm_file, path, max_mbps)
+
+    @classmethod
+    def _run(cls):
+        while True:
+            cls._run_task(cls._queue)
+
+    @classmethod
+    def _run_idle(cls):
+        try:
+            # Lowest CPU priority for this thread only (Linux); elsewhere it just waits for the prefetch queue
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            while cls._queue.unfinished_tasks:
+                time.sleep(cls.IDLE_POLL_SECONDS)
+            cls._run_task(cls._idle_queue)
+
+    @classmethod
+    def _run_task(cls, task_queue):
+        key, fn, args, kwargs = task_queue.get()
+        try:
+            fn(*args, **kwargs)
+        except Exception as e:
+            print(f"ModelPrefetcher: Prefetch task {key} failed: {e}")
+        finally:
+            with cls._lock:
+                cls._pending.discard(key)
+            task_queue.task_done()
+
+    @classmethod
+    def join(cls):
+        # Blocks until every submitted prefetch task has finished; idle tasks are not waited for
+        cls._queue.join()
+
+    @classmethod
+    def warm_file(cls, path, max_mbps=None):
+        # posix_fadvise(WILLNEED) starts kernel readahead for each chunk without copying into Python;
+        # platforms without it read the chunks instead. max_mbps <= 0 means no bandwidth cap.
+        if max_mbps is None:
+            max_mbps = PREFETCH_MAX_MBPS
+        size = os.path.getsize(path)
+        start = time.perf_counter()
+        offset = 0
+        with open(path, "rb", buffering=0) as f:
+            buffer = None if hasattr(os, "posix_fadvise") else bytearray(cls.CHUNK_SIZE)
+            while offset < size:
+                length = min(cls.CHUNK_SIZE, size - offset)
+                if buffer is None:
+                    os.posix_fadvise(f.fileno(), offset, length, os.POSIX_FADV_WILLNEED)
+                else:
+                    f.seek(offset)
+                    f.readinto(memoryview(buffer)[:length])
+                offset += length
+                if max_mbps > 0:
+                    # Sleep until the average rate is back under the cap
+                    delay = offset / (max_mbps * 1024 ** 2) - (time.perf_counter() - start)
+                    if delay > 0:
+                        time.sleep(delay)
+
+        seconds = time.perf_counter() - start
+        LoadTelemetry.increment("prefetch_files_total")
+        LoadTelemetry.increment("prefetch_bytes_total", size)
+        print(f"ModelPrefetcher: Warmed {os.path.basename(path)} ({size / 1024 ** 2:.1f} MB) in {seconds:.2f}s")
+        return size
+
+    @classmethod
+    def register_prompt_handler(cls, node_classes):
+        # Prefetches the weights of every loader node in a prompt as soon as it is queued, so the reads overlap
+        # with whatever job is currently running. Resolution happens on the prefetch thread, not in the request.
+        try:
+            from server import PromptServer
+        except ImportError:
+            return False
+
+        if getattr(PromptServer, "instance", None) is None:
+            return False
+
+        def on_prompt(json_data):
+            try:
+                for node in json_data.get("prompt", {}).values():
+                    node_class = node_classes.get(node.get("class_type"))
+                    if node_class is None or not hasattr(node_class, "prefetch"):
+                        continue
+                    # Linked inputs arrive as [node_id, output_index] and are left at their defaults
+                    inputs = {name: value for name, value in node.get("inputs", {}).items() if not isinstance(value, list)}
+                    if not isinstance(inputs.get("sub_directory"), str):
+                        continue
+                    key = ("prompt", node["class_type"], tuple(sorted(inputs.items())))
+                    cls.submit(key, node_class.prefetch, **inputs)
+            except Exception as e:
+                print(f"ModelPrefetcher: Could not schedule prefetch for queued prompt: {e}")
+            return json_data
+
+        PromptServer.instance.add_on_prompt_handler(on_prompt)
+        return True
@@ -0,0 +1,29 @@
+# safetensors_header.py
+import json
+import struct
+
+class SafetensorsHeader:
+    # Headers larger than this are treated as corrupt rather than read into memory
+    MAX_HEADER_SIZE = 100 * 1024 * 1024
+
+    @classmethod
+    def read_raw(cls, path):
+        with open(path, 'rb') as f:
+            prefix = f.read(8)
+            if len(prefix) != 8:
+                raise ValueError(f"'{path}' is too small to be a safetensors file.")
+            header_size, = struct.unpack('<Q', prefix)
+            if header_size > cls.MAX_HEADER_SIZE:
+                raise ValueError(f"'{path}' declares an invalid safetensors header size of {header_size} bytes.")
+            header_bytes = f.read(header_size)
+        if len(header_bytes) != header_size:
+            raise ValueError(f"The safetensors header of '{path}' is truncated.")
+        return header_size, header_bytes
+
+    @classmethod
+    def read(cls, path):
+        # Returns the tensor entries ({dtype, shape, data_offsets}) and the optional __metadata__ block
+        _, header_bytes = cls.read_raw(path)
+        header = json.loads(header_bytes)
+        metadata = header.pop("__metadata__", None)
+        return header, metadata
@@ -0,0 +1,67 @@
+# compile_checkpoints.py
+# Out-of-band compile step: consolidates each component of a diffusers checkpoint into one safetensors file
+# (optionally pre-cast) that the loaders memory-map instead of reading the original shards.
+# Run it with ComfyUI's Python from anywhere, e.g.:
+#
+#   python custom_nodes/ComfyUI-DiffusersLoader/scripts/compile_checkpoints.py /models/diffusers/FLUX.1-dev --dtype fp8_e4m3fn
+#   python custom_nodes/ComfyUI-DiffusersLoader/scripts/compile_checkpoints.py --all
+import os
+import sys
+import types
+import argparse
+import importlib
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMFYUI_DIR = os.path.dirname(os.path.dirname(PACKAGE_DIR))
+PACKAGE_NAME = "diffusers_loader"
+
+
+def import_package_module(name):
+    # Loads a module of this node pack without running its __init__ (which registers nodes and server routes)
+    if PACKAGE_NAME not in sys.modules:
+        package = types.ModuleType(PACKAGE_NAME)
+        package.__path__ = [PACKAGE_DIR]
+        sys.modules[PACKAGE_NAME] = package
+    return importlib.import_module(f"{PACKAGE_NAME}.{name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile diffusers checkpoints into consolidated safetensors files")
+    parser.add_argument("models", nargs="*", help="Model directories or display names as shown in the loader nodes")
+    parser.add_argument("--all", action="store_true", help="Compile every diffusers checkpoint found in the configured base paths")
+    parser.add_argument("--dtype", default="default", choices=["default", "fp8_e4m3fn", "fp8_e5m2"],
+                        help="Pre-cast the unet/transformer weights to this dtype")
+    parser.add_argument("--components", nargs="*", help="Only compile these component folders (e.g. transformer text_encoder_2)")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the compiled copy is up to date")
+    args = parser.parse_args()
+
+    sys.path.insert(0, COMFYUI_DIR)
+    utils = import_package_module("utils")
+    compiler = import_package_module("checkpoint_compiler").CheckpointCompiler
+    DiffusersUtils = utils.DiffusersUtils
+
+    if args.all:
+        targets = [full_path for _, full_path in DiffusersUtils.get_model_directories()]
+    else:
+        targets = []
+        for model in args.models:
+            if os.path.isdir(model):
+                targets.append(model)
+                continue
+            _, unique_names = DiffusersUtils.get_unique_display_names(DiffusersUtils.get_model_directories())
+            if "(" in model:
+                dir_name, index = model.rsplit(" (", 1)
+                targets.append(unique_names[dir_name][int(index[:-1]) - 1])
+            else:
+                targets.append(unique_names[model][0])
+    if not targets:
+        parser.error("Pass at least one model directory or --all")
+
+    for full_path in targets:
+        outputs = compiler.compile_model(full_path, args.dtype, components=args.components, force=args.force)
+        for component, output_path in outputs.items():
+            print(f"{full_path} [{component}] -> {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+# telemetry.py
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+import torch
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+class LoadRecord:
+    def __init__(self, kind, target):
+        self.kind = kind
+        self.target = target
+        self.started = time.time()
+        self.seconds = None
+        self.error = None
+        self.attributes = {}
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add_span(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "target": self.target,
+                "started": self.started,
+                "seconds": self.seconds,
+                "error": self.error,
+                "bytes_read": sum(span.get("bytes_read", 0) for span in self.spans),
+                "attributes": dict(self.attributes),
+                "spans": list(self.spans),
+            }
+
+class LoadTelemetry:
+    # Timed spans per load (resolve, detect, fingerprint, read_shard, cast, build, ...) plus process-wide counters.
+    # Finished loads are kept in a short history and passed to every registered hook.
+    _local = threading.local()
+    _lock = threading.Lock()
+    _counters = {}
+    _history = deque(maxlen=50)
+    _hooks = []
+
+    @staticmethod
+    def peak_rss_bytes():
+        if resource is None:
+            return None
+        # ru_maxrss is reported in KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    @staticmethod
+    def cuda_memory():
+        if not torch.cuda.is_available():
+            return None, None
+        return torch.cuda.memory_allocated(), torch.cuda.max_memory_allocated()
+
+    @classmethod
+    def current(cls):
+        stack = getattr(cls._local, "stack", None)
+        return stack[-1] if stack else None
+
+    @classmethod
+    @contextmanager
+    def attach(cls, record):
+        # Makes record the current load on this thread, e.g. inside thread pool workers
+        stack = getattr(cls._local, "stack", None)
+        if stack is None:
+            stack = cls._local.stack = []
+        stack.append(record)
+        try:
+            yield record
+        finally:
+            stack.pop()
+
+    @classmethod
+    def wrap(cls, fn):
+        # Binds fn to the load running on the calling thread so spans from worker threads are attributed to it
+        record = cls.current()
+        if record is None:
+            return fn
+        def wrapped(*args, **kwargs):
+            with cls.attach(record):
+                return fn(*args, **kwargs)
+        return wrapped
+
+    @classmethod
+    @contextmanager
+    def load(cls, kind, target):
+        # Nested loads (e.g. the UNET load inside a combined load) are recorded as part of the outer one
+        outer = cls.current()
+        if outer is not None:
+            with cls.span(f"{kind}_load", target=target):
+                yield outer
+            return
+
+        record = LoadRecord(kind, target)
+        start = time.perf_counter()
+        try:
+            with cls.attach(record):
+                yield record
+        except Exception as e:
+            record.error = str(e)
+            raise
+        finally:
+            record.seconds = time.perf_counter() - start
+            record.attributes["peak_rss_bytes"] = cls.peak_rss_bytes()
+            cls._finish(record)
+
+    @classmethod
+    @contextmanager
+    def span(cls, name, **attributes):
+        span = {"name": name, **attributes}
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            cls.record_span(name, time.perf_counter() - start, span)
+
+    @classmethod
+    def record_span(cls, name, seconds, span=None, **attributes):
+        span = dict(span or {}, **attributes)
+        span["name"] = name
+        span["seconds"] = seconds
+        span["peak_rss_bytes"] = cls.peak_rss_bytes()
+        cuda_allocated, cuda_peak = cls.cuda_memory()
+        if cuda_allocated is not None:
+            span["cuda_allocated_bytes"] = cuda_allocated
+            span["cuda_peak_bytes"] = cuda_peak
+        if span.get("bytes_read"):
+            cls.increment("bytes_read_total", span["bytes_read"])
+        record = cls.current()
+        if record is not None:
+            record.add_span(span)
+
+    @classmethod
+    def set_attribute(cls, name, value):
+        record = cls.current()
+        if record is not None:
+            with record._lock:
+                record.attributes[name] = value
+
+    @classmethod
+    def increment(cls, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with cls._lock:
+            cls._counters[key] = cls._counters.get(key, 0) + amount
+
+    @classmethod
+    def _finish(cls, record):
+        cls.increment("loads_total", kind=record.kind, status="error" if record.error else "ok")
+        cls.increment("load_seconds_total", record.seconds, kind=record.kind)
+        data = record.to_dict()
+        with cls._lock:
+            cls._history.append(data)
+            hooks = list(cls._hooks)
+        print(f"LoadTelemetry: {record.kind} load of '{record.target}' took {record.seconds:.2f}s, read {data['bytes_read'] / 1024 ** 2:.1f} MB")
+        for hook in hooks:
+            try:
+                hook(data)
+            except Exception as e:
+                print(f"LoadTelemetry: Hook {hook} failed: {e}")
+
+    @classmethod
+    def add_hook(cls, hook):
+        # hook(record_dict) is called after every finished load, e.g. to forward it to a metrics backend
+        with cls._lock:
+            cls._hooks.append(hook)
+
+    @classmethod
+    def remove_hook(cls, hook):
+        with cls._lock:
+            if hook in cls._hooks:
+                cls._hooks.remove(hook)
+
+    @classmethod
+    def snapshot(cls):
+        with cls._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in cls._counters.items()]
+            return {"counters": counters, "loads": list(cls._history)}
+
+    @classmethod
+    def export_json(cls):
+        return json.dumps(cls.snapshot(), indent=2, default=str)
+
+    @classmethod
+    def export_prometheus(cls):
+        lines = []
+        with cls._lock:
+            counters = sorted(cls._counters.items())
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f"diffusers_loader_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            label_text = ",".join(f'{key}="{value_}"' for key, value_ in labels)
+            lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._counters = {}
+            cls._history.clear()
+
+    @classmethod
+    def register_routes(cls):
+        # Exposes the metrics on ComfyUI's web server when it is available
+        try:
+            from server import PromptServer
+            from aiohttp import web
+        except ImportError:
+            return False
+
+        if getattr(PromptServer, "instance", None) is None:
+            return False
+        routes = PromptServer.instance.routes
+
+        @routes.get("/diffusers_loader/metrics")
+        async def metrics(request):
+            return web.Response(text=cls.export_prometheus(), content_type="text/plain")
+
+        @routes.get("/diffusers_loader/metrics.json")
+        async def metrics_json(request):
+            return web.Response(text=cls.export_json(), content_type="application/json")
+
+        return True
@@ -0,0 +1,72 @@
+# test_background_clip.py
+# A CLIP built by load_async must not go through comfy's load_models_gpu: the executing thread may be sampling.
+# Uses the benchmark's synthetic checkpoints and comfy stubs, so it runs with only torch and safetensors installed.
+#
+#   python -m unittest discover -s tests
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import bench_loaders
+
+
+class BackgroundClipBuildTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp()
+        os.environ["DIFFUSERS_LOADER_CACHE_DIR"] = os.path.join(cls.root, "cache")
+        base_paths, cls.models = bench_loaders.build_tree(cls.root, "tiny", 1, 0, bench_loaders.load_criteria())
+        bench_loaders.install_stubs(base_paths)
+        cls.package = bench_loaders.import_package()
+        cls.utils = sys.modules[bench_loaders.PACKAGE_NAME + ".utils"].DiffusersUtils
+
+        import comfy.sd
+        import comfy.model_management
+        cls.gpu_loads = []
+        stub_build = comfy.sd.load_text_encoder_state_dicts
+
+        def load_models_gpu(models, force_full_load=False):
+            cls.gpu_loads.append(threading.current_thread().name)
+
+        def load_text_encoder_state_dicts(state_dicts, embedding_directory=None, clip_type=None, model_options={}):
+            # Like comfy's CLIP.__init__: without an initial_device it is built on the load device and loaded there
+            if "initial_device" not in model_options:
+                comfy.model_management.load_models_gpu([None], force_full_load=True)
+            return stub_build(state_dicts, embedding_directory, clip_type, model_options)
+
+        comfy.model_management.load_models_gpu = load_models_gpu
+        comfy.sd.load_text_encoder_state_dicts = load_text_encoder_state_dicts
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.root, ignore_errors=True)
+
+    def setUp(self):
+        self.utils.clear_model_cache()
+        del self.gpu_loads[:]
+
+    def test_load_async_builds_clip_on_the_offload_device(self):
+        clip_loader = self.package.NODE_CLASS_MAPPINGS["DiffusersClipLoader"]
+        for _, model_dir in self.models:
+            clip_loader.load_async(os.path.basename(model_dir)).result(timeout=60)
+        self.assertEqual(self.gpu_loads, [])
+
+    def test_combined_load_async_builds_clip_on_the_offload_device(self):
+        combined_loader = self.package.NODE_CLASS_MAPPINGS["CombinedDiffusersLoader"]
+        _, model_dir = self.models[-1]
+        combined_loader.load_async(os.path.basename(model_dir), "flux").result(timeout=60)
+        self.assertEqual(self.gpu_loads, [])
+
+    def test_node_execution_leaves_the_device_to_comfy(self):
+        clip_loader = self.package.NODE_CLASS_MAPPINGS["DiffusersClipLoader"]
+        _, model_dir = self.models[0]
+        clip_loader.load_model(os.path.basename(model_dir))
+        self.assertEqual(len(self.gpu_loads), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,12 @@
 # unet_loader.py
 import os
 import comfy.sd
-import comfy.utils
-import json
+import comfy.model_management
 from .base_loader import DiffusersLoaderBase
 from .utils import DiffusersUtils
+from .telemetry import LoadTelemetry
+from .memory_planner import MemoryPlanner
+from .loader_config import OOM_RECOVERY_TIERS
 import torch
 
 class DiffusersUNETLoader(DiffusersLoaderBase):
@@ -14,7 +16,10 @@ class DiffusersUNETLoader(DiffusersLoaderBase):
             "required": {
                 "sub_directory": (DiffusersUtils.get_unique_display_names(DiffusersUtils.get_model_directories())[0],),
                 "transformer_parts": (["all", "part_1", "part_2", "part_3"],),
-                "weight_dtype": (["default", "fp8_e4m3fn", "fp8_e5m2"],),
+                "weight_dtype": (["default", "fp8_e4m3fn", "fp8_e5m2", "auto"],),
+            },
+            "optional": {
+                "variant": (DiffusersUtils.WEIGHT_VARIANT_CHOICES,),
             }
         }
     
@@ -23,124 +28,165 @@ class DiffusersUNETLoader(DiffusersLoaderBase):
     CATEGORY = "DiffusersLoader"
 
     @classmethod
-    def load_unet(cls, sub_directory, transformer_parts="all", weight_dtype="default"):
-        return (cls.load_model(sub_directory, transformer_parts, weight_dtype),)
+    def load_unet(cls, sub_directory, transformer_parts="all", weight_dtype="default", variant="auto"):
+        return (cls.load_model(sub_directory, transformer_parts, weight_dtype, variant),)
 
     @classmethod
-    def load_model(cls, sub_directory, transformer_parts="all", weight_dtype="default"):
-        if os.path.exists(sub_directory):
-            full_path = sub_directory
-        else:
-            model_directories = DiffusersUtils.get_model_directories()
-            _, unique_names = DiffusersUtils.get_unique_display_names(model_directories)
-            
-            if "(" in sub_directory:
-                dir_name, index = sub_directory.rsplit(" (", 1)
-                index = int(index[:-1]) - 1
-                full_path = unique_names[dir_name][index]
-            else:
-                full_path = unique_names[sub_directory][0]
-        
-        if not os.path.exists(full_path):
-            raise ValueError(f"Selected directory does not exist: {full_path}")
-        
-        model_type = cls.detect_model_type(full_path)
-        print(f"DiffusersUNETLoader: Detected model type: {model_type}")
-        
-        unet_path = cls.get_unet_path(full_path, model_type, transformer_parts)
-        DiffusersUtils.check_and_clear_cache('unet', unet_path)
-        
-        print(f"DiffusersUNETLoader: Attempting to load UNET model from: {unet_path}")
-        
+    def load_model(cls, sub_directory, transformer_parts="all", weight_dtype="default", variant="auto"):
+        key = cls.load_key("unet", sub_directory, transformer_parts, weight_dtype, variant)
+        return cls.load_shared(key, lambda: cls._load_model(sub_directory, transformer_parts, weight_dtype, variant))
+
+    @classmethod
+    def load_async(cls, sub_directory, transformer_parts="all", weight_dtype="default", variant="auto"):
+        # Future for what load_model returns, loaded on the background pool
+        key = cls.load_key("unet", sub_directory, transformer_parts, weight_dtype, variant)
+        return cls.submit_shared(key, lambda: cls._load_model(sub_directory, transformer_parts, weight_dtype, variant))
+
+    @classmethod
+    def _load_model(cls, sub_directory, transformer_parts="all", weight_dtype="default", variant="auto"):
+        with LoadTelemetry.load("unet", sub_directory):
+            job = cls.prepare_load(sub_directory, transformer_parts, weight_dtype, variant=variant)
+            if job["cached"] is not None:
+                return (job["cached"],)
+            #Return model as a tuple
+            return (cls.build_model(job, cls.read_state_dict(job)),)
+
+    @classmethod
+    def prefetch(cls, sub_directory, transformer_parts="all", weight_dtype="default", variant="auto"):
+        # Queues the files load_model would read for background page-cache warming
+        model = cls.resolve(sub_directory)
+        return DiffusersUtils.prefetch_files(cls.weight_paths(model, transformer_parts, variant=variant), dtype=cls.get_model_options(weight_dtype).get("dtype"))
+
+    @classmethod
+    def weight_paths(cls, model, transformer_parts="all", weight_dtype="default", variant="auto"):
+        # The weight file (or index) load_model reads for these inputs, memoized on the shared ResolvedModel
+        return [model.weight_file(("unet", transformer_parts, variant), lambda: cls.get_unet_path(model.full_path, model.model_type, transformer_parts, variant))]
+
+    @staticmethod
+    def get_model_options(weight_dtype):
         model_options = {}
         if weight_dtype == "fp8_e4m3fn":
             model_options["dtype"] = torch.float8_e4m3fn
         elif weight_dtype == "fp8_e5m2":
             model_options["dtype"] = torch.float8_e5m2
+        return model_options
+
+    @classmethod
+    def prepare_load(cls, sub_directory, transformer_parts="all", weight_dtype="default", plan=None, variant="auto"):
+        # Resolves everything needed to load the UNET without reading any weights.
+        # weight_dtype "auto" takes the dtype from a memory plan (the combined loader passes its own).
+        model = cls.resolve(sub_directory)
+        full_path, model_type = model.full_path, model.model_type
+        print(f"DiffusersUNETLoader: Detected model type: {model_type}")
         
-        print(f"model_options: {model_options}")
+        unet_path, = cls.weight_paths(model, transformer_parts, variant=variant)
+        DiffusersUtils.validate_weights([unet_path])
+        if weight_dtype == "auto":
+            if plan is None:
+                plan = MemoryPlanner.plan({"unet": [unet_path]}, "auto")
+            weight_dtype = plan["weight_dtype"]
+            print(f"DiffusersUNETLoader: Memory plan chose weight_dtype '{weight_dtype}' with placement '{plan['placement']}'")
+        fingerprint = DiffusersUtils.check_and_clear_cache('unet', unet_path)
+        cache_key = DiffusersUtils.model_cache_key('unet', full_path, fingerprint, weight_dtype=weight_dtype, transformer_parts=transformer_parts)
         
-        def load_from_index(index_path):
-            print(f"Load_from_index: index_path: {index_path}")
-            
-            with open(index_path, 'r') as f:
-                index_data = json.load(f)
-            weight_map = index_data['weight_map']
-            state_dict = {}
-            
-            for key, file in weight_map.items():
-                file_path = os.path.join(os.path.dirname(index_path), file)
-                part_dict = comfy.utils.load_torch_file(file_path, safe_load=True)
-                state_dict.update(part_dict)
-                del part_dict
-                #torch.cuda.empty_cache()
-            
-            print(f"Load from index function completed. Returning state_dict")
-            return state_dict
+        model_options = cls.get_model_options(weight_dtype)
+        print(f"model_options: {model_options}")
         
-        try:
-            if model_type == "AuraFlow" and transformer_parts == "all" and unet_path.endswith('index.json'):
-                
-                state_dict = load_from_index(unet_path)
-                print(f"State_dict obtained")                
-                model = cls.load_diffusion_model_from_state_dict(state_dict, model_options=model_options)
-                
-            elif model_type == "Flux" and transformer_parts == "all" and unet_path.endswith('index.json'):
-                
-                state_dict = load_from_index(unet_path)
-                print(f"State_dict obtained")  
+        return {
+            "full_path": full_path,
+            "model_type": model_type,
+            "unet_path": unet_path,
+            "model_options": model_options,
+            "cache_key": cache_key,
+            "cached": DiffusersUtils.get_cached_model(cache_key),
+        }
+
+    @classmethod
+    def read_state_dict(cls, job):
+        unet_path = job["unet_path"]
+        print(f"DiffusersUNETLoader: Attempting to load UNET model from: {unet_path}")
+        # fp8 weights are cast per tensor while reading, so the full-precision model is never resident at once
+        return DiffusersUtils.load_state_dict(unet_path, dtype=job["model_options"].get("dtype"))
+
+    @classmethod
+    def build_model(cls, job, state_dict):
+        # On out-of-memory the state dict that was already read is kept and the build is retried with the
+        # OOM_RECOVERY_TIERS strategies in order, instead of reading every shard again for the same failure
+        model_options = dict(job["model_options"])
+        tier = "default"
+        tiers = iter(OOM_RECOVERY_TIERS)
+        key_count = len(state_dict)
+        while True:
+            try:
                 model = cls.load_diffusion_model_from_state_dict(state_dict, model_options=model_options)
-                
-            else:
-                model = comfy.sd.load_diffusion_model(unet_path, model_options=model_options)
-            print("UNET/Transformer model loaded successfully")
-            #Return model as a tuple
-            return (model,)
-        
-        except RuntimeError as e:
-            if "out of memory" in str(e):
-                print("Out of memory error. Attempting to clear memory and retry...")
-                DiffusersUtils.clear_memory()
-                try:
-                    if model_type == "AuraFlow" and transformer_parts == "all" and unet_path.endswith('index.json'):
-                        # Load model using the index file (retry)
-                        state_dict = load_from_index(unet_path)                        
-                        model = cls.load_diffusion_model_from_state_dict(state_dict, model_options=model_options)
-                        
-                    elif model_type == "Flux" and transformer_parts == "all" and unet_path.endswith('index.json'):
-                        
-                        state_dict = load_from_index(unet_path)
-                        model = cls.load_diffusion_model_from_state_dict(state_dict, model_options=model_options)
-                        
-                    else:
-                        model = comfy.sd.load_diffusion_model(unet_path, model_options=model_options)
-                    print("UNET/Transformer model loaded successfully after memory clear")
-                    #Return model as a tuple
-                    return (model,)
-                except Exception as retry_e:
-                    print(f"Error loading model after memory clear: {retry_e}")
+                break
+            except (RuntimeError, MemoryError) as e:
+                if not DiffusersUtils.is_out_of_memory(e):
+                    print(f"DiffusersUNETLoader: Error loading UNET/Transformer model: {e}")
                     raise
-            else:
-                print(f"DiffusersUNETLoader: Error loading UNET/Transformer model: {e}")
-                raise
-    
+                print(f"DiffusersUNETLoader: Out of memory while building the model with tier '{tier}': {e}")
+                while True:
+                    tier = next(tiers, None)
+                    if tier is None:
+                        print("DiffusersUNETLoader: No OOM recovery tiers left")
+                        raise
+                    tier_options = cls.apply_recovery_tier(tier, state_dict, model_options)
+                    if tier_options is not None:
+                        model_options = tier_options
+                        break
+                LoadTelemetry.increment("oom_recoveries_total", tier=tier)
+                if len(state_dict) != key_count:
+                    # The failed build consumed part of the state dict, so it has to be read again after all
+                    print("DiffusersUNETLoader: State dict was modified by the failed build, reading it again")
+                    state_dict = DiffusersUtils.load_state_dict(job["unet_path"], dtype=model_options.get("dtype"))
+                    key_count = len(state_dict)
+                print(f"DiffusersUNETLoader: Retrying the build with OOM recovery tier '{tier}'")
+
+        LoadTelemetry.set_attribute("unet_build_tier", tier)
+        if tier == "fp8":
+            # Degraded models are not cached, so the next load tries the requested precision again
+            print(f"UNET/Transformer model loaded with OOM recovery tier '{tier}'")
+            return model
+        print("UNET/Transformer model loaded successfully")
+        return DiffusersUtils.cache_model(job["cache_key"], model)
+
+    @classmethod
+    def apply_recovery_tier(cls, tier, state_dict, model_options):
+        # Returns the model_options to retry with, or None when the tier cannot help.
+        # A background load never unloads comfy's models, which may be sampling on the executing thread.
+        if not cls.in_background_load():
+            comfy.model_management.unload_all_models()
+        DiffusersUtils.clear_memory()
+        if tier == "retry":
+            return model_options
+        if tier == "fp8":
+            if model_options.get("dtype") in (torch.float8_e4m3fn, torch.float8_e5m2):
+                return None
+            DiffusersUtils.cast_state_dict(state_dict, torch.float8_e4m3fn)
+            return dict(model_options, dtype=torch.float8_e4m3fn)
+        print(f"DiffusersUNETLoader: Unknown OOM recovery tier '{tier}', skipping it")
+        return None
+
     @classmethod
     def load_diffusion_model_from_state_dict(cls, state_dict, model_options):
         print("Running load_diffusion_model_from_state_dict function...")	
-        model = comfy.sd.load_diffusion_model_state_dict(state_dict, model_options=model_options)
+        with LoadTelemetry.span("build", component="unet"):
+            model = comfy.sd.load_diffusion_model_state_dict(state_dict, model_options=model_options)
+        if model is None:
+            raise RuntimeError("ERROR: Could not detect model type of the UNET/Transformer state dict")
         return model
     
     @classmethod
-    def get_unet_path(cls, full_path, model_type, transformer_parts):
+    def get_unet_path(cls, full_path, model_type, transformer_parts, variant="auto"):
         if model_type in ["AuraFlow", "Flux", "SD3"]:
             unet_folder = os.path.join(full_path, 'transformer')
             print(f"Using transformer folder for {model_type}: {unet_folder}")
             if model_type == "SD3":
-                return cls.handle_sd3_transformer(unet_folder)
+                return cls.handle_sd3_transformer(unet_folder, variant)
             if model_type == "AuraFlow":
-                return cls.handle_auraflow_transformer(unet_folder, transformer_parts)
+                return cls.handle_auraflow_transformer(unet_folder, transformer_parts, variant)
             elif model_type == "Flux":
-                return cls.handle_flux_transformer(unet_folder, transformer_parts)
+                return cls.handle_flux_transformer(unet_folder, transformer_parts, variant)
         else:  # SD15, SDXL, etc.
             unet_folder = os.path.join(full_path, 'unet')
             if not os.path.exists(unet_folder):
@@ -148,80 +194,80 @@ class DiffusersUNETLoader(DiffusersLoaderBase):
                 unet_folder = os.path.join(full_path, 'transformer')	
                 if os.path.exists(unet_folder):
                     print(f"Unet folder not found, using transformer folder: {unet_folder}")
-                    return cls.handle_flux_transformer(unet_folder, transformer_parts)
-            return DiffusersUtils.find_model_file(unet_folder)       
+                    return cls.handle_flux_transformer(unet_folder, transformer_parts, variant)
+            return DiffusersUtils.find_model_file(unet_folder, variant)       
     
     @classmethod
-    def handle_transformer(cls, unet_folder, transformer_parts, num_parts):
+    def handle_transformer(cls, unet_folder, transformer_parts, variant="auto"):
+        # Transformer folders without an index: a single weight file, a legacy combined_transformer.safetensors
+        # or unindexed shards. Consolidated copies made by compile_checkpoints.py are picked up when loading.
+        combined_file_path = os.path.join(unet_folder, "combined_transformer.safetensors")
+        part_files = [f for f in DiffusersUtils.find_model_files(unet_folder, variant=variant) if f.endswith(".safetensors") and f != combined_file_path]
+        if part_files:
+            # Parts are numbered within the best ranked variant, so fp16 and full precision shards are never mixed
+            variant = DiffusersUtils.weight_variant(part_files[0])
+            part_files = sorted(f for f in part_files if DiffusersUtils.weight_variant(f) == variant)
         if transformer_parts == "all":
-            combined_file_path = os.path.join(unet_folder, "combined_transformer.safetensors")
-            if not os.path.exists(combined_file_path):
-                print(f"Combined file not found, creating at: {combined_file_path}")
-                try:
-                    combined_file_path = DiffusersUtils.combine_safetensor_files(unet_folder, os.path.dirname(unet_folder), num_parts=num_parts)
-                except Exception as e:
-                    print(f"Error combining safetensor files: {e}")
-                    combined_file_path = DiffusersUtils.find_model_files(unet_folder, num_parts=1)[0]
-            return combined_file_path
+            if os.path.exists(combined_file_path):
+                return combined_file_path
+            if len(part_files) > 1:
+                # Loading only one of them would leave the rest of the model's weights uninitialised
+                raise ValueError(f"Found {len(part_files)} weight files without an index in {unet_folder}. "
+                                 f"Add the checkpoint's index.json or select a single file with transformer_parts.")
+            return DiffusersUtils.find_model_file(unet_folder, variant)
         else:
             part_num = int(transformer_parts.split('_')[1])
-            return DiffusersUtils.find_model_files(unet_folder, num_parts=part_num)[-1]
+            if part_num <= len(part_files):
+                return part_files[part_num - 1]
+            print(f"No file found for part {part_num}")
+            return None
 
     @classmethod
-    def handle_auraflow_transformer(cls, unet_folder, transformer_parts):
-        #Find file ending with 'index.json'
-        index_files = [f for f in os.listdir(unet_folder) if f.endswith('index.json')] 
-        print(f"Index files: {index_files}")
-        if index_files:
-            index_file = os.path.join(unet_folder, index_files[0])
+    def handle_auraflow_transformer(cls, unet_folder, transformer_parts, variant="auto"):
+        # The best ranked index, including variant indexes such as diffusion_pytorch_model.safetensors.index.fp16.json
+        index_file = DiffusersUtils.find_index_file(unet_folder, variant)
+        if index_file:
             print(f"Found index file: {index_file}")
             
             if transformer_parts == "all":
                 return index_file
             
             else:
-                with open(index_file, 'r') as f:
-                    index_data = json.load(f)    
-                    
                 part_num = int(transformer_parts.split('_')[1])
-                part_files = [file for file in index_data['weight_map'].values() if f"-0000{part_num}-of-" in file]
+                part_file = DiffusersUtils.find_index_shard(index_file, part_num)
                 
-                if part_files:
-                    return os.path.join(unet_folder, part_files[0])
+                if part_file:
+                    return part_file
                 else:
                     print(f"No file found for part {part_num}")
                     return None
         else:
             print(f"No index file found in {unet_folder}. Checking for combined transformer step")
-            return cls.handle_transformer(unet_folder, transformer_parts, num_parts=2)
+            return cls.handle_transformer(unet_folder, transformer_parts, variant)
 
     @classmethod
-    def handle_sd3_transformer(cls, unet_folder):
-        return DiffusersUtils.find_model_file(unet_folder)
+    def handle_sd3_transformer(cls, unet_folder, variant="auto"):
+        return DiffusersUtils.find_model_file(unet_folder, variant)
 
     @classmethod
-    def handle_flux_transformer(cls, unet_folder, transformer_parts):
-        index_files = [f for f in os.listdir(unet_folder) if f.endswith('index.json')]
-        if index_files:
-            index_file = os.path.join(unet_folder, index_files[0])
+    def handle_flux_transformer(cls, unet_folder, transformer_parts, variant="auto"):
+        index_file = DiffusersUtils.find_index_file(unet_folder, variant)
+        if index_file:
             print(f"Found index file: {index_file}")
             
             if transformer_parts == "all":
                 return index_file
             else:
-                with open(index_file, 'r') as f:
-                    index_data = json.load(f)
-                    
                 part_num = int(transformer_parts.split('_')[1])
-                part_files = [file for file in index_data['weight_map'].values() if f"-0000{part_num}-of-" in file]
+                part_file = DiffusersUtils.find_index_shard(index_file, part_num)
                 
-                if part_files:
-                    return os.path.join(unet_folder, part_files[0])
+                if part_file:
+                    return part_file
                 else:
                     print(f"No file found for part {part_num}")
                     return None
         
         else:
             print(f"No index file found in {unet_folder}. Checking for combined transformer step")
-            return cls.handle_transformer(unet_folder, transformer_parts, num_parts=3)
+            return cls.handle_transformer(unet_folder, transformer_parts, variant)
 
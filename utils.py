@@ -1,14 +1,40 @@
 import os
-import safetensors.torch
+import re
+import json
+import hashlib
+from safetensors import safe_open
 import torch
 import gc
+import time
+from concurrent.futures import ThreadPoolExecutor
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 import folder_paths
+import comfy.utils
+from .fingerprint import ModelFingerprint
+from .directory_index import ModelDirectoryIndex
+from .lazy_state_dict import LazyStateDict
+from .telemetry import LoadTelemetry
+from .model_cache import ModelCache, ModelCacheKey
+from .prefetcher import ModelPrefetcher
+from .safetensors_header import SafetensorsHeader
+from .checkpoint_validator import CheckpointValidator
+from .loader_config import MODEL_CACHE_RAM_MB, MODEL_CACHE_VRAM_MB, MODEL_CACHE_MAX_ENTRIES, SHARD_READ_WORKERS, MMAP_LOADING, VALIDATE_CHECKPOINTS, WEIGHT_VARIANTS
+
+# Shard numbering used by diffusers/transformers sharded checkpoints, e.g. "-00002-of-00003"
+SHARD_NUMBER_PATTERN = re.compile(r"-(\d+)-of-(\d+)")
+# Precision variant tag of a diffusers weight file, e.g. "model.fp16.safetensors", "model.fp16-00001-of-00002.safetensors"
+# or "model.safetensors.index.fp16.json"; files without one are the "default" variant
+WEIGHT_VARIANT_PATTERN = re.compile(r"\.(fp16|bf16|fp32)(?=[.-])")
 
 class DiffusersUtils:
-    _model_cache = {'clip': None, 'unet': None, 'vae': None}
-    _current_model_hashes = {'clip': None, 'unet': None, 'vae': None}
+    # The loaders' variant input; "auto" follows DIFFUSERS_LOADER_VARIANTS
+    WEIGHT_VARIANT_CHOICES = ["auto", "fp16", "bf16", "fp32"]
+    _model_cache = ModelCache(MODEL_CACHE_RAM_MB, MODEL_CACHE_VRAM_MB, MODEL_CACHE_MAX_ENTRIES)
+    _current_model_hashes = {}
+    _indexed_directories = set()
+    # (kind, sampled digest) -> the weight files first loaded under that content key
+    _shared_sources = {}
     
     @staticmethod
     def clear_memory():
@@ -18,31 +44,82 @@ class DiffusersUtils:
     
     @classmethod
     def clear_model_cache(cls):
-        cls._model_cache = {'clip': None, 'unet': None, 'vae': None}
-        cls._current_model_hashes = {'clip': None, 'unet': None, 'vae': None}
+        cls._model_cache.clear()
+        cls._current_model_hashes = {}
         cls.clear_memory()
         print("Cleared model cache")
+
+    @staticmethod
+    def model_cache_key(kind, full_path, fingerprint, weight_dtype=None, transformer_parts=None, clip_type=None, vae_type=None):
+        return ModelCacheKey(kind, os.path.realpath(full_path), fingerprint, weight_dtype, transformer_parts, clip_type, vae_type)
+
+    @classmethod
+    def get_cached_model(cls, key):
+        return cls._model_cache.get(key)
+
+    @classmethod
+    def cache_model(cls, key, model):
+        return cls._model_cache.put(key, model)
+
+    @classmethod
+    def pin_models_by_key(cls, keys, max_bytes=None, sizes=None):
+        # Pins these cache entries against eviction; returns the pinned keys for unpin_models.
+        # sizes holds estimated bytes for keys that are not cached yet.
+        return cls._model_cache.pin(keys, max_bytes, sizes)
+
+    @classmethod
+    def unpin_models(cls, keys):
+        cls._model_cache.unpin(keys)
+
+    @classmethod
+    def cached_model_keys(cls, models):
+        return cls._model_cache.keys_of(models)
+
+    @classmethod
+    def is_cached(cls, key):
+        return cls._model_cache.contains(key)
+
+    @classmethod
+    def get_cache_stats(cls):
+        return cls._model_cache.stats()
     
     @classmethod
-    def get_model_hash(cls, model_path):
-        import hashlib
-        with open(model_path, "rb") as f:
-            file_hash = hashlib.md5()
-            chunk = f.read(8192)
-            while chunk:
-                file_hash.update(chunk)
-                chunk = f.read(8192)
-        return file_hash.hexdigest()
+    def get_model_hash(cls, model_path, full_hash=False):
+        # Stat + safetensors header fingerprint by default; the full content hash only runs on request
+        if full_hash:
+            return ModelFingerprint.content_hash(model_path)
+        return ModelFingerprint.get(model_path)
     
+    @classmethod
+    def fingerprint_files(cls, paths, content_addressed=False):
+        # One fingerprint for several weight files; stat and header data only, no content reads.
+        # content_addressed combines their sampled content digests instead.
+        get_hash = ModelFingerprint.sampled_digest if content_addressed else cls.get_model_hash
+        if len(paths) == 1:
+            return get_hash(paths[0])
+        return hashlib.sha256("".join(get_hash(path) for path in paths).encode()).hexdigest()
+
     @classmethod
     def check_and_clear_cache(cls, model_type, model_path):
-        new_hash = cls.get_model_hash(model_path)
-        if cls._current_model_hashes[model_type] != new_hash:
-            print(f"Detected change in {model_type} model. Clearing cache.")
-            cls.clear_model_cache()
-            cls._current_model_hashes[model_type] = new_hash
-        else:
+        # Accepts one weight file or a list of them (e.g. every text encoder of a CLIP) and returns their fingerprint.
+        paths = list(model_path) if isinstance(model_path, (list, tuple)) else [model_path]
+        # The same fingerprint IS_CHANGED reports, so the two never disagree about whether a file changed
+        with LoadTelemetry.span("fingerprint", component=model_type, files=len(paths)):
+            new_hash = cls.fingerprint_files(paths)
+
+        hash_key = (model_type, tuple(os.path.realpath(path) for path in paths))
+        old_hash = cls._current_model_hashes.get(hash_key)
+        cls._current_model_hashes[hash_key] = new_hash
+        if old_hash is not None and old_hash != new_hash:
+            # A content-addressed copy stays cached while another checkpoint still has the same weights
+            if old_hash in cls._current_model_hashes.values():
+                print(f"Detected change in {model_type} model. Its previous weights are still used by another checkpoint.")
+            else:
+                print(f"Detected change in {model_type} model. Evicting its cached copies.")
+                cls._model_cache.evict_where(lambda key: key.kind == model_type and key.fingerprint == old_hash)
+        elif old_hash is not None:
             print(f"No change detected in {model_type} model.")
+        return new_hash
     
     @staticmethod
     def get_base_path():
@@ -54,24 +131,116 @@ class DiffusersUtils:
 
     @staticmethod
     def get_model_directories():
-        paths = []
-        base_paths = DiffusersUtils.get_base_path()
-        for base_path in base_paths:
-            if os.path.exists(base_path):
-                for root, _, files in os.walk(base_path, followlinks=True):
-                    if "model_index.json" in files:
-                        relative_path = os.path.relpath(root, start=base_path)
-                        full_path = os.path.join(base_path, relative_path)
-                        dir_name = os.path.basename(relative_path)
-                        paths.append((dir_name, full_path))
-        return paths
-
-    @staticmethod
-    def find_model_files(directory, file_parts=None):
+        # Served from the persisted directory index; only directories whose mtime changed are rescanned
+        model_directories = ModelDirectoryIndex.get_model_directories(DiffusersUtils.get_base_path())
+        DiffusersUtils.schedule_discovery_tasks(model_directories)
+        return model_directories
+
+    @classmethod
+    def schedule_discovery_tasks(cls, model_directories):
+        # Newly discovered checkpoints are validated on the idle thread, so prefetches queued by prompts are not held up.
+        # Content digests are not computed here: a load samples only the files it picks, the first time it needs them.
+        new_paths = [full_path for _, full_path in model_directories if full_path not in cls._indexed_directories]
+        if not new_paths:
+            return
+        cls._indexed_directories.update(new_paths)
+        if VALIDATE_CHECKPOINTS:
+            ModelPrefetcher.submit_idle(("validate", tuple(new_paths)), CheckpointValidator.validate_models, new_paths)
+
+    @staticmethod
+    def validate_weights(paths, allow_missing=False):
+        # Header-only check of the weight files a loader is about to read; raises ValueError for broken ones
+        if VALIDATE_CHECKPOINTS:
+            with LoadTelemetry.span("validate"):
+                CheckpointValidator.check(paths, allow_missing)
+
+    @classmethod
+    def shared_cache_key(cls, model_type, key, model_path):
+        # The content-addressed cache key for a component whose sampled digest is known and confirmed, otherwise key.
+        # Unknown digests are computed on the idle thread, so no load waits for them.
+        paths = list(model_path) if isinstance(model_path, (list, tuple)) else [model_path]
+        if None in [ModelFingerprint.known_sampled_digest(path) for path in paths]:
+            ModelPrefetcher.submit_idle(("sampled_digest",) + tuple(paths), cls.digest_files, paths)
+            return key
+        digest = cls.fingerprint_files(paths, content_addressed=True)
+        if not cls.confirm_shared(model_type, digest, paths):
+            return key
+        # Addressed by the content digest only, so every checkpoint with the same weights maps to it
+        shared_key = key._replace(path=f"content:{digest[:16]}", fingerprint=digest)
+        # A copy already cached under the path key moves to the shared key instead of being loaded again
+        if cls._model_cache.contains(key) and not cls._model_cache.contains(shared_key):
+            if not cls._model_cache.rekey(key, shared_key):
+                return key
+        return shared_key
+
+    @classmethod
+    def confirm_shared(cls, model_type, digest, model_path):
+        # Whether a component may use the content-addressed cache key for its sampled digest. The files first loaded
+        # under that digest always may; other files only once their full content hashes are known to match.
+        # Until then they load under their own key while the hashes are computed on the idle thread.
+        paths = tuple(os.path.realpath(path) for path in (model_path if isinstance(model_path, (list, tuple)) else [model_path]))
+        sources = cls._shared_sources.setdefault((model_type, digest), paths)
+        if sources == paths:
+            return True
+        ours = [ModelFingerprint.known_content_hash(path) for path in paths]
+        theirs = [ModelFingerprint.known_content_hash(path) for path in sources]
+        if None not in ours and None not in theirs:
+            if ours == theirs:
+                return True
+            print(f"DiffusersUtils: {model_type} weights {paths} match {sources} by sampled digest only, not sharing them")
+            return False
+        print(f"DiffusersUtils: {model_type} weights {paths} match a cached copy by sampled digest; "
+              f"loading them separately until their full content hashes are confirmed")
+        ModelPrefetcher.submit_idle(("content_hash",) + paths + sources, cls.hash_files, paths + sources)
+        return False
+
+    @staticmethod
+    def digest_files(paths):
+        for path in paths:
+            ModelFingerprint.sampled_digest(path)
+
+    @staticmethod
+    def hash_files(paths):
+        for path in paths:
+            ModelFingerprint.content_hash(path)
+
+    @staticmethod
+    def weight_variant(path):
+        match = WEIGHT_VARIANT_PATTERN.search(os.path.basename(path))
+        return match.group(1) if match else "default"
+
+    @staticmethod
+    def is_index_file(path):
+        name = os.path.basename(path)
+        return name.endswith(".json") and ".index" in name
+
+    @staticmethod
+    def weight_file_rank(path, variants):
+        # safetensors (single files and their indexes) before pickled .bin, then the variant preference, then the name
+        name = os.path.basename(path)
+        variant = DiffusersUtils.weight_variant(name)
+        variant_rank = variants.index(variant) if variant in variants else len(variants)
+        return (0 if ".safetensors" in name else 1, variant_rank, name)
+
+    @staticmethod
+    def find_model_files(directory, file_parts=None, variant=None):
+        # Weight files and index files ranked best first. Shards listed by an index are left out, since they are
+        # loaded through it, so an index is always paired with its own variant's shards. variant ("fp16", "bf16",
+        # "fp32" or "default") is tried before the DIFFUSERS_LOADER_VARIANTS order; "auto" or None keeps that order.
+        # Untagged files are full precision in practice, so "fp32" also matches "default".
         if not os.path.exists(directory):
             raise FileNotFoundError(f"The directory '{directory}' does not exist.")
-        files = [os.path.join(directory, f) for f in os.listdir(directory) 
-                if f.endswith((".safetensors", ".bin", "index.json"))]
+        names = os.listdir(directory)
+        sharded = set()
+        for name in names:
+            if DiffusersUtils.is_index_file(name):
+                try:
+                    with open(os.path.join(directory, name), 'r') as f:
+                        sharded.update(json.load(f).get("weight_map", {}).values())
+                except (OSError, ValueError):
+                    pass
+        files = [os.path.join(directory, f) for f in names
+                 if (f.endswith((".safetensors", ".bin")) and f not in sharded) or DiffusersUtils.is_index_file(f)]
         
         if not files:
             raise FileNotFoundError(f"No .safetensors or .bin or index.json file found in {directory}")
@@ -80,74 +249,251 @@ class DiffusersUtils:
             filtered_files = [file for file in files if any(part in file for part in file_parts)]
         else:
             filtered_files = files
+        preferred = [] if variant in (None, "auto") else ["fp32", "default"] if variant == "fp32" else [variant]
+        variants = preferred + [v for v in WEIGHT_VARIANTS if v not in preferred]
+        filtered_files = sorted(filtered_files, key=lambda file: DiffusersUtils.weight_file_rank(file, variants))
         print("Filtered files:", filtered_files)
-        return sorted(filtered_files)
+        return filtered_files
     
     
     @staticmethod
-    def find_model_file(directory):
-        files = DiffusersUtils.find_model_files(directory)
+    def find_model_file(directory, variant=None):
+        files = DiffusersUtils.find_model_files(directory, variant=variant)
         if files:
             return files[0]
         raise FileNotFoundError(f"No .safetensors or .bin pr index.json file found in {directory}")
+
+    @staticmethod
+    def find_index_file(directory, variant=None):
+        # Best ranked index in directory, or None when its weights are not sharded
+        if not os.path.isdir(directory):
+            return None
+        index_files = [f for f in DiffusersUtils.find_model_files(directory, variant=variant) if DiffusersUtils.is_index_file(f)]
+        return index_files[0] if index_files else None
     
     @staticmethod
-    def load_safetensor_paths(file_paths):
-        print("Running Loading Safetensors")
-        combined_tensors = {}
-        for file_path in file_paths:
-            print(f"Loading file: {file_path}")
-            try:
-                tensor_dict = safetensors.torch.load_file(file_path)
-                for key, value in tensor_dict.items():
-                    print(f"Processing key: {key}")
-                    if key in combined_tensors:
-                        try:
-                            combined_tensors[key] = torch.cat((combined_tensors[key], value), dim=0)
-                        except RuntimeError as e:
-                            print(f"Error concatenating tensors for key {key}: {e}")
-                            print(f"Shapes: combined {combined_tensors[key].shape}, new {value.shape}")
-                            # Instead of raising, we'll skip this tensor and continue
-                            print(f"Skipping problematic tensor: {key}")
-                    else:
-                        combined_tensors[key] = value
-                print(f"Finished processing file: {file_path}")
-                # Free up memory
-                del tensor_dict
-                torch.cuda.empty_cache()
-            except Exception as e:
-                print(f"Error processing file {file_path}: {e}")
-                # Continue to the next file instead of stopping
-                continue
-        print("Combining Safetensors completed")
-        return combined_tensors
-        
-    #This function is not used. Will be removed in the subsequent release
-    @staticmethod
-    def combine_safetensor_files(directory, base_path, num_parts):
-        print(f"Running combine_safetensor_files for directory: {directory}")
-        part_files = DiffusersUtils.find_model_files(directory, num_parts=num_parts)
-        print("Path to part_files:", part_files)
-        try:
-            combined_tensors = DiffusersUtils.load_safetensor_paths(part_files)
-            print("Combined tensors keys:", list(combined_tensors.keys()))
-            
-            if "text_encoder" in directory:
-                combined_file_path = os.path.join(directory, "combined_text_encoder.safetensors")
-            elif "transformer" in directory:
-                combined_file_path = os.path.join(directory, "combined_transformer.safetensors")
+    def group_weight_map(weight_map):
+        # Invert the index weight_map (tensor key -> shard file) into shard file -> tensor keys
+        shards = {}
+        for key, file_name in weight_map.items():
+            shards.setdefault(file_name, []).append(key)
+        return shards
+
+    @staticmethod
+    def cast_tensor(tensor, dtype):
+        # Only matrix/conv weights are pre-cast; biases, norms and scalars keep their precision for comfy to handle
+        if dtype is None or tensor.dtype == dtype or not tensor.is_floating_point() or tensor.ndim < 2:
+            return tensor
+        return tensor.to(dtype)
+
+    @staticmethod
+    def load_shard(file_path, keys=None, skip_missing=False, dtype=None):
+        # Reads the given keys (all keys when None), casting each tensor to dtype as soon as it has been read
+        file_name = os.path.basename(file_path)
+        cast_seconds = 0.0
+        with LoadTelemetry.span("read_shard", file=file_name) as span:
+            if file_path.endswith(".safetensors"):
+                with safe_open(file_path, framework="pt", device="cpu") as f:
+                    available = set(f.keys())
+                    if keys is None:
+                        keys = list(f.keys())
+                    missing = [key for key in keys if key not in available]
+                    if missing and not skip_missing:
+                        raise KeyError(f"{len(missing)} tensor(s) listed in the index are missing from {file_path}, e.g. '{missing[0]}'")
+                    part_dict = {}
+                    bytes_read = 0
+                    for key in keys:
+                        if key not in available:
+                            continue
+                        tensor = f.get_tensor(key)
+                        bytes_read += tensor.nelement() * tensor.element_size()
+                        cast_start = time.perf_counter()
+                        part_dict[key] = DiffusersUtils.cast_tensor(tensor, dtype)
+                        cast_seconds += time.perf_counter() - cast_start
+                        del tensor
+            else:
+                loaded = comfy.utils.load_torch_file(file_path, safe_load=True)
+                bytes_read = os.path.getsize(file_path)
+                if keys is None:
+                    keys = list(loaded.keys())
+                missing = [key for key in keys if key not in loaded]
+                if missing and not skip_missing:
+                    raise KeyError(f"{len(missing)} tensor(s) listed in the index are missing from {file_path}, e.g. '{missing[0]}'")
+                cast_start = time.perf_counter()
+                part_dict = {key: DiffusersUtils.cast_tensor(loaded.pop(key), dtype) for key in keys if key in loaded}
+                cast_seconds += time.perf_counter() - cast_start
+            span["bytes_read"] = bytes_read
+            span["tensors"] = len(part_dict)
+
+        if dtype is not None:
+            LoadTelemetry.record_span("cast", cast_seconds, file=file_name, dtype=str(dtype))
+        return part_dict
+
+    @staticmethod
+    def load_state_dict(path, lazy=None, dtype=None, key_prefixes=None):
+        # Single entry point used by the loaders: index .json -> shard loader, safetensors -> optionally memory-mapped.
+        # With a dtype, tensors are cast one at a time while reading so the full-precision copy never exists at once.
+        # With key_prefixes, only tensors whose key starts with one of them are read.
+        if lazy is None:
+            lazy = MMAP_LOADING
+        compiled_path = DiffusersUtils.find_compiled(path, dtype)
+        if compiled_path is not None:
+            print(f"DiffusersUtils: Using compiled checkpoint {compiled_path} for {path}")
+            path = compiled_path
+        if path.endswith(".json"):
+            return DiffusersUtils.load_sharded_checkpoint(path, lazy=lazy, dtype=dtype, key_prefixes=key_prefixes)
+        if key_prefixes is not None and path.endswith(".safetensors"):
+            header, _ = SafetensorsHeader.read(path)
+            keys = DiffusersUtils.select_keys(header, key_prefixes)
+            print(f"DiffusersUtils: Selected {len(keys)} of {len(header)} tensors from {path}")
+            if lazy:
+                with LoadTelemetry.span("map", file=os.path.basename(path)):
+                    return LazyStateDict.from_shards([(path, keys)], transform=DiffusersUtils.tensor_transform(dtype))
+            return DiffusersUtils.load_shard(path, keys, dtype=dtype)
+        if lazy and path.endswith(".safetensors"):
+            print(f"DiffusersUtils: Memory-mapping {path}")
+            with LoadTelemetry.span("map", file=os.path.basename(path)):
+                return LazyStateDict.from_file(path, transform=DiffusersUtils.tensor_transform(dtype))
+        if dtype is not None:
+            print(f"DiffusersUtils: Reading {path} with streaming cast to {dtype}")
+            state_dict = DiffusersUtils.load_shard(path, dtype=dtype)
+        else:
+            with LoadTelemetry.span("read", file=os.path.basename(path), bytes_read=os.path.getsize(path)):
+                state_dict = comfy.utils.load_torch_file(path, safe_load=True)
+        if key_prefixes is not None:
+            # Pickled checkpoints can only be read whole, so the selection is applied afterwards
+            state_dict = {key: state_dict[key] for key in DiffusersUtils.select_keys(state_dict, key_prefixes)}
+        return state_dict
+
+    @staticmethod
+    def select_keys(keys, key_prefixes=None):
+        # Keys (in their original order) equal to or starting with one of key_prefixes; all keys when None
+        if key_prefixes is None:
+            return list(keys)
+        key_prefixes = tuple(key_prefixes)
+        return [key for key in keys if key.startswith(key_prefixes)]
+
+    @staticmethod
+    def shard_number(file_name):
+        # "diffusion_pytorch_model-00012-of-00015.safetensors" -> (12, 15); None for unnumbered files
+        match = SHARD_NUMBER_PATTERN.search(os.path.basename(file_name))
+        if match is None:
+            return None
+        return int(match.group(1)), int(match.group(2))
+
+    @staticmethod
+    def find_index_shard(index_path, part_num):
+        # The shard file an index numbers as part_num, whatever the zero padding or shard count
+        with open(index_path, 'r') as f:
+            weight_map = json.load(f)['weight_map']
+        for file_name in DiffusersUtils.group_weight_map(weight_map):
+            number = DiffusersUtils.shard_number(file_name)
+            if number is not None and number[0] == part_num:
+                return os.path.join(os.path.dirname(index_path), file_name)
+        return None
+
+    @staticmethod
+    def find_compiled(path, dtype=None):
+        from .checkpoint_compiler import CheckpointCompiler
+        return CheckpointCompiler.find_compiled(path, dtype)
+
+    @staticmethod
+    def prefetch_files(paths, dtype=None, max_mbps=None):
+        # Queues the files behind the given weight paths (compiled copy, index shards or the file itself)
+        # for background page-cache warming and returns them
+        files = []
+        for path in ([paths] if isinstance(paths, str) else paths):
+            compiled_path = DiffusersUtils.find_compiled(path, dtype)
+            if compiled_path is not None:
+                files.append(compiled_path)
+            elif path.endswith(".json"):
+                with open(path, 'r') as f:
+                    weight_map = json.load(f)['weight_map']
+                shard_paths = [os.path.join(os.path.dirname(path), file_name) for file_name in DiffusersUtils.group_weight_map(weight_map)]
+                files.extend(shard_path for shard_path in shard_paths if os.path.exists(shard_path))
             else:
-                raise ValueError(f"Unsupported directory for combining files: {directory}")
-            
-            print(f"Saving combined file to: {combined_file_path}")
-            safetensors.torch.save_file(combined_tensors, combined_file_path)
-            print("Combined file saved successfully")
-            
-            return combined_file_path
-        except Exception as e:
-            print(f"Error in combine_safetensor_files: {e}")
-            # If combining fails, return the path to the first file as a fallback
-            return part_files[0]
+                files.append(path)
+        for file_path in files:
+            ModelPrefetcher.submit_file(file_path, max_mbps)
+        return files
+
+    @staticmethod
+    def cast_state_dict(state_dict, dtype):
+        # Casts an already-read state dict in place; a lazy one casts the tensors still on disk as they are read
+        if isinstance(state_dict, LazyStateDict):
+            state_dict.set_transform(DiffusersUtils.tensor_transform(dtype))
+            return state_dict
+        for key in list(state_dict.keys()):
+            state_dict[key] = DiffusersUtils.cast_tensor(state_dict[key], dtype)
+        return state_dict
+
+    @staticmethod
+    def is_out_of_memory(error):
+        # CUDA OOMs and host allocation failures; comfy surfaces both as RuntimeError or MemoryError
+        if isinstance(error, (MemoryError, torch.cuda.OutOfMemoryError)):
+            return True
+        message = str(error).lower()
+        return "out of memory" in message or "can't allocate memory" in message
+
+    @staticmethod
+    def tensor_transform(dtype):
+        if dtype is None:
+            return None
+        return lambda tensor: DiffusersUtils.cast_tensor(tensor, dtype)
+
+    @staticmethod
+    def load_sharded_checkpoint(index_path, skip_missing=False, max_workers=None, lazy=False, dtype=None, key_prefixes=None):
+        print(f"DiffusersUtils: Loading sharded checkpoint from index: {index_path}")
+        with open(index_path, 'r') as f:
+            index_data = json.load(f)
+        base_path = os.path.dirname(index_path)
+
+        weight_map = index_data['weight_map']
+        if key_prefixes is not None:
+            # The selection is made on the index, so shards without any selected tensor are never opened
+            weight_map = {key: weight_map[key] for key in DiffusersUtils.select_keys(weight_map, key_prefixes)}
+            print(f"DiffusersUtils: Selected {len(weight_map)} of {len(index_data['weight_map'])} tensors from {index_path}")
+
+        shards = []
+        for file_name, keys in DiffusersUtils.group_weight_map(weight_map).items():
+            file_path = os.path.join(base_path, file_name)
+            if not os.path.exists(file_path):
+                if skip_missing:
+                    print(f"DiffusersUtils: Shard not found, skipping: {file_path}")
+                    continue
+                raise FileNotFoundError(f"The shard '{file_path}' listed in {index_path} does not exist.")
+            shards.append((file_path, keys))
+
+        if lazy and all(file_path.endswith(".safetensors") for file_path, _ in shards):
+            # One zero-copy view over every shard; tensors are only read when the model consumes them
+            with LoadTelemetry.span("map", file=os.path.basename(index_path), shards=len(shards)):
+                state_dict = LazyStateDict.from_shards(shards, skip_missing=skip_missing, transform=DiffusersUtils.tensor_transform(dtype))
+            print(f"DiffusersUtils: Memory-mapped {len(state_dict)} tensors from {index_path}")
+            return state_dict
+
+        def read_shard(shard):
+            file_path, keys = shard
+            print(f"DiffusersUtils: Reading shard {os.path.basename(file_path)} ({len(keys)} tensors)")
+            return DiffusersUtils.load_shard(file_path, keys, skip_missing=skip_missing, dtype=dtype)
+
+        if max_workers is None:
+            max_workers = SHARD_READ_WORKERS
+        max_workers = max(1, min(max_workers, len(shards)))
+
+        state_dict = {}
+        # Each shard is opened exactly once and only the keys mapped to it are read.
+        # Shards are merged in index order, so the result does not depend on which read finishes first.
+        if max_workers == 1:
+            for shard in shards:
+                state_dict.update(read_shard(shard))
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for part_dict in executor.map(LoadTelemetry.wrap(read_shard), shards):
+                    state_dict.update(part_dict)
+                    del part_dict
+
+        print(f"DiffusersUtils: Loaded {len(state_dict)} tensors from {index_path}")
+        return state_dict
 
     @staticmethod
     def get_unique_display_names(model_directories):
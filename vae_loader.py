@@ -1,10 +1,13 @@
 # vae_loader.py
 import os
+import threading
 import torch
 import comfy.sd
 import comfy.utils
 from .base_loader import DiffusersLoaderBase
 from .utils import DiffusersUtils
+from .telemetry import LoadTelemetry
+from .loader_config import SHARE_COMPONENTS
 
 class DiffusersVAELoader(DiffusersLoaderBase):
     # Moving the VAE_Configs to a Json file might be for a future refactor!
@@ -14,12 +17,21 @@ class DiffusersVAELoader(DiffusersLoaderBase):
         "taesd3": {"scale": 1.5305, "shift": 0.0609},
         "taef1": {"scale": 0.3611, "shift": 0.1159},
     }
+    # TAESD preview VAEs built so far, keyed by (vae_type, encoder fingerprint, decoder fingerprint), and the
+    # vae_approx listing, keyed by folder and re-read only when the folder's mtime changes
+    _taesd_cache = {}
+    _taesd_index = {}
+    _taesd_lock = threading.Lock()
+
     @classmethod
     def INPUT_TYPES(cls):
         return {
             "required": {
                 "sub_directory": (DiffusersUtils.get_unique_display_names(DiffusersUtils.get_model_directories())[0],),
                 "vae_type": (["default"] + list(cls.VAE_CONFIGS.keys()),),
+            },
+            "optional": {
+                "variant": (DiffusersUtils.WEIGHT_VARIANT_CHOICES,),
             }
         }
     
@@ -28,67 +40,161 @@ class DiffusersVAELoader(DiffusersLoaderBase):
     CATEGORY = "DiffusersLoader"
 
     @classmethod
-    def load_vae(cls, sub_directory, vae_type="default"):
-        return (cls.load_model(sub_directory, vae_type),)
+    def load_vae(cls, sub_directory, vae_type="default", variant="auto"):
+        return (cls.load_model(sub_directory, vae_type, variant),)
 
     @classmethod
-    def load_model(cls, sub_directory, vae_type="default"):
-        if vae_type == "default":
-            return cls.load_default_vae(sub_directory)
-        else:
-            return cls.load_taesd(vae_type)
+    def load_model(cls, sub_directory, vae_type="default", variant="auto"):
+        key = cls.load_key("vae", sub_directory, vae_type, variant)
+        return cls.load_shared(key, lambda: cls._load_model(sub_directory, vae_type, variant))
 
     @classmethod
-    def load_default_vae(cls, sub_directory):
-        if os.path.exists(sub_directory):
-            full_path = sub_directory
-        else:       
-            model_directories = DiffusersUtils.get_model_directories()
-            _, unique_names = DiffusersUtils.get_unique_display_names(model_directories)
-            
-            if "(" in sub_directory:
-                dir_name, index = sub_directory.rsplit(" (", 1)
-                index = int(index[:-1]) - 1
-                full_path = unique_names[dir_name][index]
+    def load_async(cls, sub_directory, vae_type="default", variant="auto"):
+        # Future for what load_model returns, loaded on the background pool
+        key = cls.load_key("vae", sub_directory, vae_type, variant)
+        return cls.submit_shared(key, lambda: cls._load_model(sub_directory, vae_type, variant))
+
+    @classmethod
+    def _load_model(cls, sub_directory, vae_type="default", variant="auto"):
+        with LoadTelemetry.load("vae", sub_directory):
+            if vae_type == "default":
+                return cls.load_default_vae(sub_directory, variant)
             else:
-                full_path = unique_names[sub_directory][0]
-        
-        if not os.path.exists(full_path):
-            raise ValueError(f"Selected directory does not exist: {full_path}")
+                return cls.load_taesd(vae_type)
+
+    @classmethod
+    def load_default_vae(cls, sub_directory, variant="auto"):
+        job = cls.prepare_load(sub_directory, "default", variant)
+        if job["cached"] is not None:
+            return job["cached"]
+        return cls.build_model(job, cls.read_state_dict(job))
+
+    @classmethod
+    def prefetch(cls, sub_directory, vae_type="default", variant="auto"):
+        # Queues the files load_model would read for background page-cache warming; TAESD weights are small and skipped
+        if vae_type != "default":
+            return []
+        return DiffusersUtils.prefetch_files(cls.weight_paths(cls.resolve(sub_directory), variant=variant))
+
+    @classmethod
+    def weight_paths(cls, model, vae_type="default", variant="auto"):
+        # The files load_model reads: the checkpoint's VAE (memoized on the shared ResolvedModel) or the TAESD pair
+        if vae_type != "default":
+            return list(cls.find_taesd_files(vae_type))
+        return [model.weight_file(("vae", variant), lambda: DiffusersUtils.find_model_file(model.folder("vae"), variant))]
+
+    @classmethod
+    def prepare_load(cls, sub_directory, vae_type="default", variant="auto"):
+        # Resolves everything needed to load the VAE without reading any weights
+        if vae_type != "default":
+            return cls.prepare_taesd(vae_type)
+
+        model = cls.resolve(sub_directory)
+        full_path = model.full_path
         
-        vae_folder = os.path.join(full_path, "vae")
-        vae_path = DiffusersUtils.find_model_file(vae_folder)
-        DiffusersUtils.check_and_clear_cache('vae', vae_path)
+        vae_path, = cls.weight_paths(model, variant=variant)
+        DiffusersUtils.validate_weights([vae_path])
+        # Checkpoints with identical VAE weights share one cached VAE
+        fingerprint = DiffusersUtils.check_and_clear_cache('vae', vae_path)
+        cache_key = DiffusersUtils.model_cache_key('vae', full_path, fingerprint, vae_type="default")
+        if SHARE_COMPONENTS:
+            cache_key = DiffusersUtils.shared_cache_key('vae', cache_key, vae_path)
         
-        print(f"DiffusersVAELoader: Attempting to load VAE model from: {vae_path}")
+        return {
+            "vae_type": vae_type,
+            "full_path": full_path,
+            "vae_path": vae_path,
+            "cache_key": cache_key,
+            "cached": DiffusersUtils.get_cached_model(cache_key),
+        }
+
+    @classmethod
+    def read_state_dict(cls, job):
+        if job["vae_type"] != "default":
+            return cls.load_taesd_state_dict(job["vae_type"], job["encoder_path"], job["decoder_path"])
+        print(f"DiffusersVAELoader: Attempting to load VAE model from: {job['vae_path']}")
+        return DiffusersUtils.load_state_dict(job["vae_path"])
 
+    @classmethod
+    def build_model(cls, job, vae_sd):
         try:
-            vae_sd = comfy.utils.load_torch_file(vae_path)
-            return comfy.sd.VAE(sd=vae_sd)
+            with LoadTelemetry.span("build", component="vae"):
+                vae = comfy.sd.VAE(sd=vae_sd)
         except Exception as e:
             print(f"DiffusersVAELoader: Error loading VAE model: {e}")
             raise
-        
-    @staticmethod
-    def load_taesd(vae_type):
-        sd = {}
+        if job.get("taesd_key") is not None:
+            with cls._taesd_lock:
+                # Drop the copy built from an older version of the same files
+                for key in [key for key in cls._taesd_cache if key[0] == job["vae_type"]]:
+                    del cls._taesd_cache[key]
+                cls._taesd_cache[job["taesd_key"]] = vae
+            return vae
+        if job["cache_key"] is None:
+            return vae
+        return DiffusersUtils.cache_model(job["cache_key"], vae)
+
+    @classmethod
+    def load_taesd(cls, vae_type):
+        job = cls.prepare_taesd(vae_type)
+        if job["cached"] is not None:
+            return job["cached"]
+        return cls.build_model(job, cls.read_state_dict(job))
+
+    @classmethod
+    def prepare_taesd(cls, vae_type):
+        # TAESD VAEs are tiny and used in nearly every session, so one instance per vae_type and file version is kept
+        encoder_path, decoder_path = cls.find_taesd_files(vae_type)
+        taesd_key = (vae_type, DiffusersUtils.get_model_hash(encoder_path), DiffusersUtils.get_model_hash(decoder_path))
+        with cls._taesd_lock:
+            cached = cls._taesd_cache.get(taesd_key)
+        LoadTelemetry.increment("cache_hits_total" if cached is not None else "cache_misses_total", kind="taesd")
+        return {
+            "vae_type": vae_type,
+            "encoder_path": encoder_path,
+            "decoder_path": decoder_path,
+            "taesd_key": taesd_key,
+            "cache_key": None,
+            "cached": cached,
+        }
+
+    @classmethod
+    def find_taesd_files(cls, vae_type):
         vae_approx_path = os.path.join(os.path.dirname(DiffusersUtils.get_base_path()[0]), "vae_approx")
         # Validation check for vae_approx_path
         if not os.path.exists(vae_approx_path):
             raise FileNotFoundError(f"The vae_approx path '{vae_approx_path}' does not exist.")
-        
-        encoder_file = next(f for f in os.listdir(vae_approx_path) if f.startswith(f"{vae_type}_encoder."))
-        decoder_file = next(f for f in os.listdir(vae_approx_path) if f.startswith(f"{vae_type}_decoder."))
-        
+
+        mtime = os.stat(vae_approx_path).st_mtime_ns
+        with cls._taesd_lock:
+            entry = cls._taesd_index.get(vae_approx_path)
+            if entry is None or entry[0] != mtime:
+                # "<vae_type>_encoder.<ext>" / "<vae_type>_decoder.<ext>"; the first file in name order wins
+                files = {}
+                for file_name in sorted(os.listdir(vae_approx_path)):
+                    name_type, _, part = file_name.split(".", 1)[0].rpartition("_")
+                    if part in ("encoder", "decoder"):
+                        files.setdefault(name_type, {}).setdefault(part, os.path.join(vae_approx_path, file_name))
+                entry = (mtime, files)
+                cls._taesd_index[vae_approx_path] = entry
+        parts = entry[1].get(vae_type, {})
+
         #Validation check for presence of encoder and decoder_file
-        if encoder_file is None or decoder_file is None:
-            raise FileNotFoundError(f"No encoder or decoder file found in {vae_approx_path}.")
+        if "encoder" not in parts or "decoder" not in parts:
+            raise FileNotFoundError(f"No encoder or decoder file found for {vae_type} in {vae_approx_path}.")
+        return parts["encoder"], parts["decoder"]
+
+    @staticmethod
+    def load_taesd_state_dict(vae_type, encoder_path=None, decoder_path=None):
+        sd = {}
+        if encoder_path is None or decoder_path is None:
+            encoder_path, decoder_path = DiffusersVAELoader.find_taesd_files(vae_type)
         
-        enc = comfy.utils.load_torch_file(os.path.join(vae_approx_path, encoder_file))
+        enc = comfy.utils.load_torch_file(encoder_path)
         for k in enc:
             sd[f"taesd_encoder.{k}"] = enc[k]
         
-        dec = comfy.utils.load_torch_file(os.path.join(vae_approx_path, decoder_file))
+        dec = comfy.utils.load_torch_file(decoder_path)
         for k in dec:
             sd[f"taesd_decoder.{k}"] = dec[k]
         
@@ -101,4 +207,4 @@ class DiffusersVAELoader(DiffusersLoaderBase):
             sd["vae_scale"] = torch.tensor(1.0)
             sd["vae_shift"] = torch.tensor(0.0)
         
-        return comfy.sd.VAE(sd=sd)
\ No newline at end of file
+        return sd
@@ -0,0 +1,278 @@
+# warm_pool.py
+import json
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import wait as wait_futures
+from .base_loader import DiffusersLoaderBase
+from .combined_diffusers_loader import CombinedDiffusersLoader
+from .utils import DiffusersUtils
+from .loader_config import WARM_POOL_PIN_MB
+
+class ModelWarmPool:
+    # Loads a known set of checkpoints into the model cache in the background (through CombinedDiffusersLoader.load_async)
+    # and pins them, so the first job that needs one finds it resident. Each component is pinned by its cache key before
+    # its weights are read, so it is protected from the moment it is cached and does not count against the cache limits.
+    # Pins are kept up to WARM_POOL_PIN_MB, counting a loading checkpoint at its size from the weight headers; a
+    # checkpoint that would exceed it is still loaded and cached, but unpinned.
+    DEFAULT_OPTIONS = {
+        "clip_type": "stable_diffusion",
+        "transformer_parts": "all",
+        "vae_type": "default",
+        "weight_dtype": "default",
+        "concurrent_loading": False,
+        "variant": "auto",
+    }
+    _entries = OrderedDict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def normalize(cls, spec):
+        # A display name/path, or a dict with CombinedDiffusersLoader.load_models' arguments
+        if isinstance(spec, str):
+            spec = {"sub_directory": spec}
+        unknown = set(spec) - set(cls.DEFAULT_OPTIONS) - {"sub_directory"}
+        if unknown or not spec.get("sub_directory"):
+            raise ValueError(f"Invalid warm pool entry {spec!r}: needs sub_directory, unknown options {sorted(unknown)}")
+        options = dict(cls.DEFAULT_OPTIONS)
+        options.update(spec)
+        return options
+
+    @staticmethod
+    def pool_key(options):
+        return DiffusersLoaderBase.load_key("combined", options["sub_directory"], options["clip_type"],
+                                            options["transformer_parts"], options["vae_type"], options["weight_dtype"], options["variant"])
+
+    @classmethod
+    def warm(cls, specs, pin=True):
+        # Starts loading every checkpoint that is not already loading or ready; returns the status of the whole pool
+        for spec in specs:
+            try:
+                options = cls.normalize(spec)
+                key = cls.pool_key(options)
+            except (ValueError, KeyError, IndexError) as e:
+                # Unknown names and options are reported with the rest of the pool instead of failing the whole batch
+                print(f"ModelWarmPool: Cannot warm {spec!r}: {e!r}")
+                options = dict(cls.DEFAULT_OPTIONS, sub_directory=str(spec.get("sub_directory") if isinstance(spec, dict) else spec))
+                with cls._lock:
+                    cls._entries[("invalid", options["sub_directory"])] = {
+                        "options": options, "state": "failed", "pin": False, "cache_keys": [], "pinned_keys": [],
+                        "error": f"not found or invalid: {e!r}", "queued_at": time.time(), "seconds": None,
+                    }
+                continue
+            with cls._lock:
+                entry = cls._entries.get(key)
+                if entry is not None and entry["state"] == "loading":
+                    entry["pin"] = entry["pin"] or pin
+                    continue
+                if entry is not None and entry["state"] == "ready" and all(DiffusersUtils.is_cached(k) for k in entry["cache_keys"]):
+                    if pin and not entry["pinned_keys"]:
+                        entry["pin"] = True
+                        cls._pin(entry)
+                    continue
+                entry = {
+                    "options": options,
+                    "state": "loading",
+                    "pin": pin,
+                    "cache_keys": [],
+                    "pinned_keys": [],
+                    "error": None,
+                    "queued_at": time.time(),
+                    "seconds": None,
+                }
+                cls._entries[key] = entry
+            print(f"ModelWarmPool: Loading {options['sub_directory']} in the background")
+            entry["future"] = CombinedDiffusersLoader.load_async(**options, on_prepared=lambda cache_keys, key=key, entry=entry: cls._prepared(key, entry, cache_keys))
+            entry["future"].add_done_callback(lambda future, key=key, entry=entry: cls._loaded(key, entry, future))
+        return cls.status()
+
+    @classmethod
+    def _prepared(cls, key, entry, sizes):
+        # Runs on the loading thread once the component cache keys are known and before any weights are read.
+        # The estimated sizes are reserved against the pin budget, so checkpoints loading at the same time cannot
+        # all be admitted past it.
+        with cls._lock:
+            entry["cache_keys"] = list(sizes)
+            if cls._entries.get(key) is entry and entry["pin"]:
+                cls._pin(entry, sizes)
+                entry["pin"] = bool(entry["pinned_keys"])
+
+    @classmethod
+    def _loaded(cls, key, entry, future):
+        try:
+            models = future.result()
+        except Exception as e:
+            with cls._lock:
+                entry.update(state="failed", error=str(e), seconds=time.time() - entry["queued_at"], future=None)
+                cls._unpin(entry)
+            print(f"ModelWarmPool: Loading {entry['options']['sub_directory']} failed: {e}")
+            return
+        with cls._lock:
+            if not entry["cache_keys"]:
+                # A load with the same key was already in flight, so on_prepared never ran for this entry
+                entry["cache_keys"] = DiffusersUtils.cached_model_keys(models)
+            # Only the cache keys are kept, so an unpinned checkpoint can still be evicted
+            entry.update(state="ready", seconds=time.time() - entry["queued_at"], future=None)
+            if cls._entries.get(key) is entry and entry["pin"] and not entry["pinned_keys"]:
+                cls._pin(entry)
+        print(f"ModelWarmPool: {entry['options']['sub_directory']} is ready after {entry['seconds']:.1f}s")
+
+    @staticmethod
+    def pin_budget():
+        return WARM_POOL_PIN_MB * 1024 * 1024 if WARM_POOL_PIN_MB >= 0 else None
+
+    @classmethod
+    def _pin(cls, entry, sizes=None):
+        entry["pinned_keys"] = DiffusersUtils.pin_models_by_key(entry["cache_keys"], cls.pin_budget(), sizes)
+        if entry["cache_keys"] and not entry["pinned_keys"]:
+            print(f"ModelWarmPool: {entry['options']['sub_directory']} would exceed the pin budget, leaving it unpinned")
+
+    @staticmethod
+    def _unpin(entry):
+        if entry["pinned_keys"]:
+            DiffusersUtils.unpin_models(entry["pinned_keys"])
+            entry["pinned_keys"] = []
+
+    @classmethod
+    def release(cls, sub_directory=None):
+        # Unpins and forgets the entries for one checkpoint (any of its option sets), or all of them
+        target = None
+        if sub_directory is not None:
+            try:
+                target = DiffusersLoaderBase.load_key("combined", sub_directory)[1]
+            except (ValueError, KeyError, IndexError):
+                pass
+        with cls._lock:
+            for key in list(cls._entries):
+                entry = cls._entries[key]
+                if sub_directory is not None and key[1] not in (target, sub_directory):
+                    continue
+                cls._unpin(entry)
+                del cls._entries[key]
+
+    @classmethod
+    def wait(cls, timeout=None):
+        with cls._lock:
+            futures = [entry["future"] for entry in cls._entries.values() if entry.get("future") is not None]
+        wait_futures(futures, timeout=timeout)
+        return cls.status()
+
+    @classmethod
+    def status(cls):
+        # One record per pooled checkpoint; "evicted" means it finished loading but is no longer in the model cache
+        with cls._lock:
+            records = []
+            for entry in cls._entries.values():
+                state = entry["state"]
+                if state == "ready" and not all(DiffusersUtils.is_cached(key) for key in entry["cache_keys"]):
+                    state = "evicted"
+                records.append(dict(
+                    {name: value for name, value in entry["options"].items() if name != "concurrent_loading"},
+                    state=state,
+                    pinned=sum(1 for key in entry["pinned_keys"] if DiffusersUtils.is_cached(key)),
+                    cached=len(entry["cache_keys"]),
+                    seconds=entry["seconds"],
+                    error=entry["error"],
+                ))
+            return records
+
+    @classmethod
+    def report(cls):
+        records = cls.status()
+        ready = sum(1 for record in records if record["state"] == "ready")
+        lines = [f"{ready} of {len(records)} checkpoint(s) ready"]
+        for record in records:
+            line = (f"{record['state']}: {record['sub_directory']} [{record['weight_dtype']}, clip {record['clip_type']}, "
+                    f"vae {record['vae_type']}, parts {record['transformer_parts']}]")
+            if record["state"] in ("ready", "evicted"):
+                line += f" pinned {record['pinned']}/{record['cached']} components, loaded in {record['seconds']:.1f}s"
+            if record["error"]:
+                line += f" error: {record['error']}"
+            lines.append(line)
+        return "\n".join(lines)
+
+    @classmethod
+    def parse_specs(cls, text):
+        # One checkpoint per line: "name | weight_dtype=fp8_e4m3fn | vae_type=taesd"; empty lines and # comments are skipped
+        specs = []
+        for line in text.splitlines():
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            name, *options = [part.strip() for part in line.split("|")]
+            spec = {"sub_directory": name}
+            for option in options:
+                option_name, _, value = option.partition("=")
+                value = value.strip()
+                spec[option_name.strip()] = value.lower() in ("1", "true", "yes") if option_name.strip() == "concurrent_loading" else value
+            specs.append(spec)
+        return specs
+
+    @classmethod
+    def register_routes(cls):
+        # GET /diffusers_loader/warm_pool reports readiness, POST adds {"checkpoints": [...], "pin": true},
+        # POST /diffusers_loader/warm_pool/release unpins {"sub_directory": name} or everything
+        try:
+            from server import PromptServer
+            from aiohttp import web
+        except ImportError:
+            return False
+
+        if getattr(PromptServer, "instance", None) is None:
+            return False
+        routes = PromptServer.instance.routes
+
+        @routes.get("/diffusers_loader/warm_pool")
+        async def warm_pool_status(request):
+            return web.Response(text=json.dumps(cls.status()), content_type="application/json")
+
+        @routes.post("/diffusers_loader/warm_pool")
+        async def warm_pool_add(request):
+            body = await request.json()
+            try:
+                records = cls.warm(body.get("checkpoints", []), pin=body.get("pin", True))
+            except (ValueError, TypeError) as e:
+                return web.Response(status=400, text=str(e))
+            return web.Response(text=json.dumps(records), content_type="application/json")
+
+        @routes.post("/diffusers_loader/warm_pool/release")
+        async def warm_pool_release(request):
+            body = await request.json() if request.can_read_body else {}
+            cls.release(body.get("sub_directory"))
+            return web.Response(text=json.dumps(cls.status()), content_type="application/json")
+
+        return True
+
+class DiffusersWarmPool:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "checkpoints": ("STRING", {"multiline": True, "default": ""}),
+                "pin": ("BOOLEAN", {"default": True}),
+                "wait": ("BOOLEAN", {"default": False}),
+            }
+        }
+
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("report",)
+    FUNCTION = "warm"
+    OUTPUT_NODE = True
+    CATEGORY = "DiffusersLoader/Combined"
+
+    @classmethod
+    def warm(cls, checkpoints, pin=True, wait=False):
+        ModelWarmPool.warm(ModelWarmPool.parse_specs(checkpoints), pin=pin)
+        if wait:
+            ModelWarmPool.wait()
+        text = ModelWarmPool.report()
+        print(f"DiffusersWarmPool:\n{text}")
+        return {"ui": {"text": [text]}, "result": (text,)}
+
+    @classmethod
+    def IS_CHANGED(cls, **kwargs):
+        # Readiness changes while the background loads run, so the report is never reused
+        return float("nan")
+
+NODE_CLASS_MAPPINGS = {"DiffusersWarmPool": DiffusersWarmPool}
+NODE_DISPLAY_NAME_MAPPINGS = {"DiffusersWarmPool": "Diffusers Warm Pool"}